@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+
+#*******************************************************************************
+# Copyright (c) 2024-2024
+# Author(s): Volker Fischer
+#*******************************************************************************
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA
+#*******************************************************************************
+
+# Streaming version of analyze.m: per channel level histograms (same bins as in xairautomix.py),
+# percentiles and max levels of a meter log. The log is memory mapped and processed in chunks so
+# that the memory usage does not depend on the log length, optionally in parallel processes.
+# usage: python3 analyze.py meters_20240505_200000.xrl [--jobs 4] [--report summary.json] [--plot]
+#        python3 analyze.py test.dat --raw --skip-frames 50000
+
+import argparse, json, numpy
+from concurrent.futures import ProcessPoolExecutor
+from meters import level_bins
+import meterlog
+
+hist_len     = 128   # same as in xairautomix.py
+num_channels = 16    # mic inputs
+percentiles  = [50, 90, 99]
+max_db_share = 0.05  # analyze.m: max level is the highest bin with more than 0.05 % of the largest bin
+
+
+def open_frames(path, raw):
+  # raw int16 input values of all frames (memory mapped) and the dB scale
+  if raw: # legacy test.dat: 18 int16 values per frame without header
+    return (numpy.memmap(path, dtype="<i2", mode="r").reshape(-1, 18), 1 / 256)
+  log = meterlog.MeterLog(path)
+  return (log.records["inputs"], log.scale)
+
+
+def analyze_range(path, raw, start, end, chunk_frames):
+  # histograms, max levels and per chunk max levels of the frames start..end
+  (frames, scale) = open_frames(path, raw)
+  histograms = numpy.zeros(num_channels * hist_len, dtype=numpy.int64)
+  offsets    = numpy.arange(num_channels) * hist_len
+  max_levels = numpy.full(num_channels, -128.0)
+  chunk_max  = []
+  for i in range(start, end, chunk_frames):
+    values     = frames[i:min(end, i + chunk_frames), :num_channels] * scale # only this chunk is in memory
+    histograms += numpy.bincount((level_bins(values, hist_len) + offsets).ravel(), minlength=len(histograms))
+    chunk_max.append(values.max(axis=0))
+    max_levels = numpy.maximum(max_levels, chunk_max[-1])
+  return (histograms.reshape(num_channels, hist_len), max_levels, chunk_max)
+
+
+def histogram_percentile(histogram, p):
+  cumulative = numpy.cumsum(histogram)
+  return int(numpy.searchsorted(cumulative, p / 100 * cumulative[-1])) / hist_len * 128 - 128
+
+
+def summarize(histograms, max_levels, names):
+  summary = []
+  for ch in range(num_channels):
+    histogram = histograms[ch]
+    if histogram.sum() == 0:
+      summary.append({"channel": ch + 1, "name": names[ch], "frames": 0})
+      continue
+    share = histogram / histogram.max() * 100
+    summary.append({"channel": ch + 1, "name": names[ch], "frames": int(histogram.sum()),
+                    "max_dB": float(max_levels[ch]),
+                    "max_hist_dB": numpy.nonzero(share > max_db_share)[0][-1] / hist_len * 128 - 128,
+                    "percentiles_dB": {str(p): histogram_percentile(histogram, p) for p in percentiles}})
+  return summary
+
+
+def plot(histograms, chunk_max, summary, chunk_s):
+  import matplotlib.pyplot as plt
+  levels = numpy.arange(hist_len) / hist_len * 128 - 128
+  for ch in range(num_channels):
+    if summary[ch]["frames"] == 0:
+      continue
+    plt.figure()
+    plt.subplot(2, 1, 1); plt.plot(numpy.arange(len(chunk_max)) * chunk_s, chunk_max[:, ch]); plt.grid()
+    plt.xlabel("s"); plt.ylabel("dB"); plt.title(f"Max Input Level of Channel {ch + 1}, {summary[ch]['name']}")
+    plt.subplot(2, 1, 2); plt.bar(levels, histograms[ch] / histograms[ch].max() * 100); plt.xlim([-128, 0]); plt.grid()
+    plt.xlabel("dB"); plt.ylabel("%"); plt.title(f"Histogram, max {summary[ch]['max_hist_dB']:g} dB")
+  plt.show()
+
+
+def main():
+  parser = argparse.ArgumentParser(description="Level statistics of a meter log")
+  parser.add_argument("path")
+  parser.add_argument("--raw", action="store_true", help="legacy log file (18 int16 values per frame)")
+  parser.add_argument("--skip-frames", type=int, default=0, help="ignore the initialization phase")
+  parser.add_argument("--chunk-frames", type=int, default=12000, help="frames per processing step")
+  parser.add_argument("--jobs", type=int, default=1, help="number of parallel processes")
+  parser.add_argument("--report", help="write the summary as JSON to this file")
+  parser.add_argument("--plot", action="store_true")
+  args = parser.parse_args()
+
+  (frames, _) = open_frames(args.path, args.raw)
+  names = [f"ch {ch + 1}" for ch in range(num_channels)]
+  if not args.raw:
+    log_names = meterlog.MeterLog(args.path).channel_names[:num_channels]
+    names     = log_names + names[len(log_names):]
+  # the frames are stored row by row, so the parallel processes get consecutive frame ranges
+  # (each of them touches only its own part of the file) instead of separate channels
+  (start, end) = (min(args.skip_frames, len(frames)), len(frames))
+  step   = -(-(end - start) // args.jobs) if end > start else 1
+  step   = -(-step // args.chunk_frames) * args.chunk_frames # keep the chunk borders for the plot
+  ranges = [(args.path, args.raw, i, min(end, i + step), args.chunk_frames) for i in range(start, end, step)]
+  if args.jobs > 1:
+    with ProcessPoolExecutor(args.jobs) as executor:
+      results = list(executor.map(analyze_range, *zip(*ranges)))
+  else:
+    results = [analyze_range(*r) for r in ranges]
+
+  histograms = sum((r[0] for r in results), numpy.zeros((num_channels, hist_len), dtype=numpy.int64))
+  max_levels = numpy.max([r[1] for r in results], axis=0) if results else numpy.full(num_channels, -128.0)
+  chunk_max  = numpy.array([m for r in results for m in r[2]]).reshape(-1, num_channels)
+  summary    = summarize(histograms, max_levels, names)
+  print(f"{end - start} frames")
+  for s in summary:
+    if s["frames"] > 0:
+      p = ", ".join(f"{k}%: {v:6.1f}" for (k, v) in s["percentiles_dB"].items())
+      print(f"{s['channel']:2} {s['name']:12} max {s['max_dB']:6.1f} dB, hist max {s['max_hist_dB']:6.1f} dB, {p} dB")
+  if args.report:
+    with open(args.report, "w") as file:
+      json.dump({"path": args.path, "frames": end - start, "channels": summary}, file, indent=2)
+  if args.plot:
+    plot(histograms, chunk_max, summary, args.chunk_frames * 0.05)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+
+#*******************************************************************************
+# Copyright (c) 2024-2024
+# Author(s): Volker Fischer
+#*******************************************************************************
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA
+#*******************************************************************************
+
+# Several mixers in one process on one asyncio event loop: each mixer is a MixerSession with its
+# own UDP endpoint, AutoMixEngine state (histograms, max/min levels, parameter cache), meters
+# subscription, feedback detection and meter log. The meter processing runs directly in the event
+# loop, blocking engine operations (bulk queries, gain application, mixer reset) run in the default
+# executor where they wait for the replies which the event loop receives.
+# usage: python3 asyncmixer.py                          (all mixers which answer the /xinfo broadcast)
+#        python3 asyncmixer.py 192.168.1.10 192.168.1.11 --feedback --auto-gain-s 60
+#        python3 asyncmixer.py 127.0.0.1:10024 127.0.0.1:10025=band2.json (two mockmixer.py instances)
+
+import argparse, asyncio, struct, threading
+from osccodec import encode_message, decode_message
+from xairautomix import AutoMixEngine, default_band, meters_requests, write_period_s
+from bandconfig import BandConfig
+from meters import rta_frequency
+from pythonx32 import x32 # path is set by xairautomix
+
+mixer_port        = 10024
+discover_s        = 1    # time to wait for /xinfo replies
+status_s          = 10   # status output period
+session_file_path = "meters_{mixer}_%Y%m%d_%H%M%S.xrl" # one meter log file per mixer and run
+
+
+class MixerProtocol(asyncio.DatagramProtocol):
+  def __init__(self, on_message):
+    self.on_message = on_message
+    self.invalid    = 0
+
+  def datagram_received(self, data, address):
+    try:
+      message = decode_message(data)
+    except (ValueError, IndexError, struct.error):
+      self.invalid += 1
+      return
+    self.on_message(message, address)
+
+
+class AsyncMixer:
+  # x32.BehringerX32 compatible subset used by AutoMixEngine (set_value and the value conversions)
+  # on an asyncio datagram endpoint, received messages go to on_message in the event loop
+  db_to_float   = x32.BehringerX32.db_to_float # pure conversion functions, no connection needed
+  freq_to_float = x32.BehringerX32.freq_to_float
+  q_to_float    = x32.BehringerX32.q_to_float
+
+  def __init__(self, address, port=mixer_port):
+    self.address    = address
+    self.port       = port
+    self.on_message = None
+    self.info       = None
+    self.transport  = None
+
+  async def connect(self, timeout=1):
+    self.loop        = asyncio.get_running_loop()
+    self.loop_thread = threading.get_ident()
+    (self.transport, self.protocol) = await self.loop.create_datagram_endpoint(
+      lambda: MixerProtocol(self.receive), remote_addr=(self.address, self.port))
+    self.info_reply = self.loop.create_future()
+    self.set_value("/info", [])
+    self.info = await asyncio.wait_for(self.info_reply, timeout) # [version, name, model, firmware]
+
+  def receive(self, message, address):
+    if message.address == "/info" and not self.info_reply.done():
+      self.info_reply.set_result(message.data)
+    elif self.on_message:
+      self.on_message(message)
+
+  def set_value(self, address, values, readback=True):
+    # no readback, the reply arrives via on_message; can be called from executor threads
+    data = encode_message(address, values)
+    if threading.get_ident() == self.loop_thread:
+      self.transport.sendto(data)
+    else:
+      self.loop.call_soon_threadsafe(self.transport.sendto, data)
+
+  def close(self):
+    if self.transport:
+      self.transport.close()
+
+
+async def discover(timeout_s=discover_s, port=mixer_port, broadcast="255.255.255.255"):
+  # all mixers which answer the /xinfo broadcast: IP address -> [IP address, name, model, firmware]
+  found = {}
+  def on_message(message, address):
+    if message.address == "/xinfo":
+      found[address[0]] = message.data
+  (transport, _) = await asyncio.get_running_loop().create_datagram_endpoint(
+    lambda: MixerProtocol(on_message), local_addr=("0.0.0.0", 0), allow_broadcast=True)
+  transport.sendto(encode_message("/xinfo"), (broadcast, port))
+  await asyncio.sleep(timeout_s)
+  transport.close()
+  return found
+
+
+class MixerSession:
+  def __init__(self, address, port=mixer_port, band=default_band, log_meters=True, feedback=False, auto_gain_s=None):
+    self.address     = address
+    self.port        = port
+    self.band        = band
+    self.log_meters  = log_meters
+    self.feedback    = feedback
+    self.auto_gain_s = auto_gain_s
+    self.tasks       = []
+    self.engine      = None
+    self.detections  = asyncio.Queue() # RTA bins with detected feedback, cancelled one after the other
+
+  async def start(self):
+    self.mixer = AsyncMixer(self.address, self.port)
+    await self.mixer.connect()
+    log_path    = session_file_path.replace("{mixer}", f"{self.address}_{self.port}")
+    self.engine = AutoMixEngine(self.mixer, self.log_meters, log_path, self.band)
+    self.engine.is_XR16   = "XR16" in self.mixer.info[2]
+    self.engine.set_feedback_cancellation(self.feedback)
+    self.mixer.on_message = self.receive
+    self.engine.configure_rta(31) # 31: MainLR on XAIR16
+    self.tasks.append(asyncio.create_task(self.meters_request_loop()))
+    await self.run(self.engine.fill_parameter_cache)
+    self.tasks.append(asyncio.create_task(self.write_loop()))
+    self.tasks.append(asyncio.create_task(self.feedback_loop()))
+    if self.log_meters:
+      self.tasks.append(asyncio.create_task(self.meter_log_loop()))
+    if self.auto_gain_s:
+      self.tasks.append(asyncio.create_task(self.auto_gain_loop()))
+
+  async def stop(self):
+    for task in self.tasks:
+      task.cancel()
+    await asyncio.gather(*self.tasks, return_exceptions=True)
+    if self.engine:
+      self.engine.exit = True
+      self.engine.writes.send_due(None) # nothing queued gets lost on exit
+    self.mixer.close()
+
+  async def run(self, function, *args):
+    # blocking engine operation in the default executor, the event loop keeps receiving
+    return await asyncio.get_running_loop().run_in_executor(None, function, *args)
+
+  def receive(self, message):
+    self.engine.receive_message(message)
+    while not self.engine.rta_queue.empty(): # filled by the RTA meter callback if feedback cancellation is on
+      for index in self.engine.detect_feedback(self.engine.rta_queue.get_nowait()):
+        self.detections.put_nowait(index)
+
+  async def meters_request_loop(self):
+    while True:
+      for (address, values) in meters_requests:
+        self.mixer.set_value(address, values, False)
+      await asyncio.sleep(1) # every second update meters request
+
+  async def write_loop(self):
+    # scheduled (coalesced, rate limited) writes of this mixer
+    while True:
+      await asyncio.sleep(write_period_s)
+      self.engine.writes.send_due(self.engine.writes.per_period)
+
+  async def feedback_loop(self):
+    # one cancellation at a time (as the feedback thread of the engine), otherwise concurrent
+    # cancellations could pick the same free master EQ band
+    while True:
+      index = await self.detections.get()
+      try:
+        await self.run(self.engine.cancel_feedback, index)
+      except Exception as e:
+        print(f"{self.address}:{self.port}: feedback cancellation failed ({type(e).__name__}: {e})")
+
+  async def meter_log_loop(self):
+    writer = await self.run(self.engine.open_meter_log)
+    try:
+      while True:
+        await asyncio.sleep(1) # every second append logging file
+        await self.run(self.engine.write_meter_log, writer)
+    finally:
+      self.engine.write_meter_log(writer)
+      writer.close()
+
+  async def auto_gain_loop(self):
+    while True:
+      await asyncio.sleep(self.auto_gain_s)
+      await self.run(self.engine.apply_optimal_gains)
+
+  def status(self):
+    frame   = self.engine.frame
+    ringing = ", ".join(f"{rta_frequency(i):.0f} Hz" for i in self.engine.persistent_rta_bins()[0]) or "none"
+    return f"{self.address}:{self.port} {self.mixer.info[1]} ({self.mixer.info[2]}): {frame.seq} meter frames, " \
+           f"loudest input {frame.input_values.max():.1f} dB, ringing: {ringing}, " \
+           f"{self.mixer.protocol.invalid} invalid messages"
+
+
+async def run_sessions(args):
+  band = BandConfig.load(args.band) if args.band else default_band
+  if args.mixers: # ip[:port][=band file]
+    specs     = [m.split("=", 1) if "=" in m else [m, None] for m in args.mixers]
+    addresses = [(a.split(":")[0], int(a.split(":")[1]) if ":" in a else mixer_port,
+                  BandConfig.load(path) if path else band) for (a, path) in specs]
+  else:
+    addresses = [(address, mixer_port, band) for address in await discover(args.discover_s)]
+  sessions = [MixerSession(address, port, band, not args.no_log, args.feedback, args.auto_gain_s)
+              for (address, port, band) in addresses]
+  results  = await asyncio.gather(*(session.start() for session in sessions), return_exceptions=True)
+  started  = []
+  for (session, result) in zip(sessions, results):
+    if isinstance(result, BaseException):
+      print(f"{session.address}:{session.port}: no connection ({type(result).__name__})")
+      session.mixer.close()
+    else:
+      started.append(session)
+  if not started:
+    print("no mixer found")
+    return
+  try:
+    while True:
+      for session in started:
+        print(session.status())
+      await asyncio.sleep(status_s)
+  finally:
+    await asyncio.gather(*(session.stop() for session in started))
+
+
+def main():
+  parser = argparse.ArgumentParser(description="Auto mixing for several X-AIR mixers in one process")
+  parser.add_argument("mixers", nargs="*", help="mixer IP addresses (optionally with :port and =band file), " \
+                                                "default: discover")
+  parser.add_argument("--band", help="band setup file of all mixers without own band file")
+  parser.add_argument("--discover-s", type=float, default=discover_s, help="time to wait for discovery replies")
+  parser.add_argument("--feedback", action="store_true", help="enable feedback cancellation")
+  parser.add_argument("--auto-gain-s", type=float, help="apply the optimal gains every given seconds")
+  parser.add_argument("--no-log", action="store_true", help="do not write meter log files")
+  args = parser.parse_args()
+  try:
+    asyncio.run(run_sessions(args))
+  except KeyboardInterrupt:
+    pass
+
+
+if __name__ == '__main__':
+  main()
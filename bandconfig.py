@@ -0,0 +1,254 @@
+#*******************************************************************************
+# Copyright (c) 2024-2024
+# Author(s): Volker Fischer
+#*******************************************************************************
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA
+#*******************************************************************************
+
+# Band setup (channels, instrument groups, monitor busses) loaded from a JSON or YAML file or from
+# the channel_dict/busses_dict tables in xairautomix.py. The OSC addresses are built once on load,
+# the mixer setup table (address -> encoded values) once per mixer model on first use.
+# file format (JSON, YAML with the same structure):
+# {"groups":   {"vocal": {"color": 1, "flags": ["VOCALDYN"]}, ...},
+#  "channels": [{"name": "Miguel", "fader": -2, "gain": 28, "hp": 121, "group": "vocal",
+#                "eq": [{"gain": 4, "freq": 124.7, "q": 1}, {"type": 0, "freq": 1490}], "flags": []}, ...],
+#  "busses":   [{"name": "Miguel Mon L", "levels": [-90, ...], "fader": -10, "pans": [0, ...], "flags": []}, ...]}
+
+import json
+
+eq_band_types = {"gain", "freq", "q", "type"}
+max_channels  = 16 # mic inputs of the X-AIR mixers
+
+
+class Group:
+  __slots__ = ("name", "color", "flags")
+
+  def __init__(self, name, color, flags=()):
+    (self.name, self.color, self.flags) = (name, color, tuple(flags))
+
+
+class EqBand:
+  # PEQ band (gain, freq, q) or special case with type and frequency only (gain is None)
+  __slots__ = ("gain", "freq", "q", "type")
+
+  def __init__(self, freq, gain=None, q=None, type=None):
+    (self.freq, self.gain, self.q, self.type) = (freq, gain, q, type)
+
+
+class Channel:
+  __slots__ = ("index", "name", "fader", "gain", "hp", "eq", "group", "flags", "prefix", "headamp", "mix_on")
+
+  def __init__(self, index, name, fader, gain, hp, eq, group, flags=()):
+    (self.index, self.name, self.fader, self.gain, self.hp) = (index, name, fader, gain, hp)
+    (self.eq, self.group, self.flags) = (eq, group, tuple(flags))
+    self.prefix  = f"/ch/{index + 1:#02}"
+    self.mix_on  = self.prefix + "/mix/on"
+    # headamp gain address and range, [0]: XR12/XR18, [1]: XR16 where the headamps of channels
+    # 9..16 are at 17..24 with a gain range of -12..20 dB
+    self.headamp = ((f"/headamp/{index + 1:#02}/gain", 60 - (-12)),
+                    (f"/headamp/{index + 9:#02}/gain", 20 - (-12)) if index >= 8 else
+                    (f"/headamp/{index + 1:#02}/gain", 60 - (-12)))
+
+
+class Bus:
+  __slots__ = ("index", "name", "levels", "fader", "pans", "flags", "prefix")
+
+  def __init__(self, index, name, levels, fader, pans=None, flags=()):
+    (self.index, self.name, self.levels, self.fader) = (index, name, levels, fader)
+    (self.pans, self.flags) = (pans, tuple(flags))
+    self.prefix = f"/bus/{index + 1}"
+
+
+def headamp_to_float(headamp, x):
+  # encoded headamp gain for x dB, rounded to 0.5 dB
+  x = round(x * 2) / 2
+  (address, gain_range) = headamp
+  max_value = 0.984375 if gain_range == 20 - (-12) else 0.9861111
+  return (address, max(0, min(max_value, (x + 12) / gain_range)))
+
+
+class BandConfig:
+  __slots__ = ("channels", "busses", "groups", "setups")
+
+  def __init__(self, channels, busses, groups):
+    (self.channels, self.busses, self.groups) = (channels, busses, groups)
+    self.setups = {} # (is_XR16, dyn_thresh) -> mixer setup table
+    if len(channels) > max_channels:
+      raise ValueError(f"{len(channels)} channels, the mixer has {max_channels}")
+    for bus in busses:
+      for values in ([bus.levels] + ([bus.pans] if bus.pans is not None else [])):
+        if len(values) != len(channels):
+          raise ValueError(f"bus {bus.name}: {len(values)} values for {len(channels)} channels")
+
+  @staticmethod
+  def from_dicts(channel_dict, busses_dict, busses_pan_dict, groups):
+    # the positional tables of xairautomix.py, groups: name -> [color, flags]
+    group_objects = {id(g): Group(name, g[0], g[1] if len(g) > 1 else []) for (name, g) in groups.items()}
+    channels = [Channel(ch, c[0], c[1], c[2], c[3], [EqBand(e[1], e[0], e[2]) if len(e) > 2 else EqBand(e[1], type=e[0])
+                                                    for e in c[4]],
+                        group_objects[id(c[5])], c[6] if len(c) > 6 else [])
+                for (ch, c) in sorted(channel_dict.items())]
+    busses   = [Bus(bus, b[0], b[1], b[2], busses_pan_dict.get(bus), b[3] if len(b) > 3 else [])
+                for (bus, b) in sorted(busses_dict.items())]
+    return BandConfig(channels, busses, list(group_objects.values()))
+
+  @staticmethod
+  def load(path):
+    with open(path) as file:
+      if path.endswith(".yaml") or path.endswith(".yml"):
+        import yaml # optional, only needed for YAML band files
+        data = yaml.safe_load(file)
+      else:
+        data = json.load(file)
+    try:
+      groups   = {name: Group(name, g["color"], g.get("flags", [])) for (name, g) in data["groups"].items()}
+      channels = []
+      for (ch, c) in enumerate(data["channels"]):
+        for e in c.get("eq", []):
+          if not set(e) <= eq_band_types:
+            raise ValueError(f"channel {c['name']}: unknown EQ keys {sorted(set(e) - eq_band_types)}")
+        channels.append(Channel(ch, c["name"], c["fader"], c["gain"], c["hp"], [EqBand(**e) for e in c.get("eq", [])],
+                                groups[c["group"]], c.get("flags", [])))
+      busses = [Bus(bus, b["name"], b["levels"], b["fader"], b.get("pans"), b.get("flags", []))
+                for (bus, b) in enumerate(data["busses"])]
+    except KeyError as e:
+      raise ValueError(f"{path}: missing entry {e}")
+    return BandConfig(channels, busses, list(groups.values()))
+
+  def save(self, path):
+    def eq_band(e):
+      return {"type": e.type, "freq": e.freq} if e.gain is None else {"gain": e.gain, "freq": e.freq, "q": e.q}
+    data = {"groups":   {g.name: {"color": g.color, "flags": list(g.flags)} for g in self.groups},
+            "channels": [{"name": c.name, "fader": c.fader, "gain": c.gain, "hp": c.hp, "group": c.group.name,
+                          "eq": [eq_band(e) for e in c.eq], "flags": list(c.flags)} for c in self.channels],
+            "busses":   [dict({"name": b.name, "levels": b.levels, "fader": b.fader, "flags": list(b.flags)},
+                              **({"pans": b.pans} if b.pans is not None else {})) for b in self.busses]}
+    with open(path, "w") as file:
+      json.dump(data, file, indent=1)
+
+  def names(self):
+    return [c.name for c in self.channels]
+
+  def mixer_setup(self, mixer, is_XR16, dyn_thresh):
+    # desired mixer state as OSC address -> values, the insertion order is the order of sending,
+    # the conversion functions of the mixer are pure, so the table is built once per mixer model
+    key = (is_XR16, dyn_thresh)
+    if key not in self.setups:
+      self.setups[key] = build_mixer_setup(self, mixer, is_XR16, dyn_thresh)
+    return self.setups[key]
+
+
+def build_mixer_setup(band, mixer, is_XR16, dyn_thresh):
+  setup = {}
+  setup["/lr/mix/fader"] = [0] # default: main LR fader to minimum
+  for bus in band.busses[:6]:
+    setup[bus.prefix + "/config/name"]  = [bus.name]
+    setup[bus.prefix + "/mix/fader"]    = [mixer.db_to_float(bus.fader)]
+    setup[bus.prefix + "/config/color"] = [3] # default: monitor busses are in yellow
+    setup[bus.prefix + "/eq/on"]        = [0] # default: bus EQ off
+    if "LINK" in bus.flags and bus.index % 2 == 1: # special bus settings
+      setup[f"/config/buslink/{bus.index}-{bus.index + 1}"] = [1]
+    for rtn in range(4):
+      setup[f"/rtn/{rtn + 1}/mix/{bus.index + 1:#02}/level"] = [0] # default: FX level to lowest value
+  for c in band.channels:
+    (ch, p) = (c.index, c.prefix)
+    (address, value) = headamp_to_float(c.headamp[is_XR16], c.gain)
+    setup[address] = [value]
+    setup[p + "/config/color"] = [c.group.color]
+    setup[p + "/config/name"]  = [c.name]
+    setup[c.mix_on]            = [1]  # default: unmute channel
+    setup[p + "/mix/fader"]    = [mixer.db_to_float(c.fader)] # note: unmute necessary
+    setup[p + "/config/insrc"] = [ch] # default: linear in/out mapping
+    setup[p + "/mix/lr"]       = [1]  # default: send to LR master
+    setup[p + "/grp/mute"]     = [0]  # default: no mute group
+    setup[f"/-stat/solosw/{ch + 1:#02}"]    = [0] # default: no Solo
+    setup[p + "/grp/dca"]      = [0]  # default: no DCA group
+    setup[f"/headamp/{ch + 1:#02}/phantom"] = [0] # default: no phantom power
+    setup[p + "/mix/pan"]      = [0.5] # default: middle position
+    setup[p + "/gate/on"]      = [0]  # default: gate off
+    setup[p + "/dyn/on"]       = [0]  # default: compressor off
+    setup[p + "/eq/on"]        = [1]  # default: EQ on
+    setup[p + "/preamp/hpon"]  = [1]  # default: high-pass on
+    setup[p + "/preamp/hpf"]   = [mixer.freq_to_float(c.hp, 400)]
+    for i in range(4):
+      setup[f"{p}/eq/{i + 1}/type"] = [2]   # default: EQ, PEQ
+      setup[f"{p}/eq/{i + 1}/g"]    = [0.5] # default: EQ, 0 dB gain
+    for (i, e) in enumerate(c.eq): # individual channel EQ settings
+      if e.gain is not None:
+        setup[f"{p}/eq/{i + 1}/g"] = [(e.gain + 15) / 30]
+        setup[f"{p}/eq/{i + 1}/f"] = [mixer.freq_to_float(e.freq)]
+        setup[f"{p}/eq/{i + 1}/q"] = [mixer.q_to_float(e.q)]
+      else: # special case: type and frequency
+        setup[f"{p}/eq/{i + 1}/type"] = [e.type]
+        setup[f"{p}/eq/{i + 1}/f"]    = [mixer.freq_to_float(e.freq)]
+    setup[p + "/dyn/keysrc"] = [0]   # default comp: key source SELF
+    setup[p + "/dyn/mode"]   = [0]   # default comp: compresser mode
+    setup[p + "/dyn/auto"]   = [0]   # default comp: auto compresser off
+    setup[p + "/dyn/knee"]   = [0.4] # default comp: knee 2
+    setup[p + "/dyn/det"]    = [0]   # default comp: det PEAK
+    setup[p + "/dyn/env"]    = [1]   # default comp: env LOG
+    setup[p + "/dyn/mix"]    = [1.0] # default comp: mix 100 %
+    setup[p + "/dyn/thr"]    = [(dyn_thresh + 60) / 60] # default comp: pre-defined threshold
+    if "VOCALDYN" in c.group.flags:      # vocal dynamic presets:
+      setup[p + "/dyn/on"]          = [1]          # vocal default: compresser on
+      setup[p + "/dyn/ratio"]       = [5]          # vocal default: ratio 3
+      setup[p + "/dyn/mgain"]       = [0.25]       # vocal default: gain 6 dB
+      setup[p + "/dyn/attack"]      = [0.08333333] # vocal default: attack 10 ms
+      setup[p + "/dyn/hold"]        = [0.54]       # vocal default: hold 10 ms
+      setup[p + "/dyn/release"]     = [0.45]       # vocal default: release 101 ms
+      setup[p + "/dyn/filter/on"]   = [1]          # vocal default: filter on
+      setup[p + "/dyn/filter/type"] = [6]          # vocal default: filter type 3
+      setup[p + "/dyn/filter/f"]    = [0.495]      # vocal default: filter 611 Hz
+    for bus in range(10):
+      setup[f"{p}/mix/{bus + 1:#02}/tap"]   = [3] # default: bus Pre Fader
+      setup[f"{p}/mix/{bus + 1:#02}/level"] = [0]
+      if bus < len(band.busses):
+        setup[f"{p}/mix/{bus + 1:#02}/level"] = [mixer.db_to_float(band.busses[bus].levels[ch], True)]
+    for bus in range(0, 6, 2): # adjust pan in send busses per channel (every second bus)
+      if bus < len(band.busses) and band.busses[bus].pans is not None:
+        setup[f"{p}/mix/{bus + 1:#02}/pan"] = [(int(band.busses[bus].pans[ch] / 2) + 50) / 100]
+      else:
+        setup[f"{p}/mix/{bus + 1:#02}/pan"] = [0.5] # default: middle position
+    if ch % 2 == 1:
+      setup[f"/config/chlink/{ch}-{ch + 1}"] = [0] # default: no stereo link
+    if "NOMIX" in c.flags: # special channel settings
+      setup[p + "/mix/lr"] = [0]
+    if "PHANT" in c.flags:
+      setup[f"/headamp/{ch + 1:#02}/phantom"] = [1]
+    if "LINK" in c.flags and ch % 2 == 1:
+      setup[f"/config/chlink/{ch}-{ch + 1}"] = [1]
+  # global settings, only needed once and not per channel
+  setup["/fx/1/type"]         = [0]          # default: FX1 Hall Reverb (for vocals)
+  setup["/fx/1/par/01"]       = [0.1]        # default: FX1 PRE DEL 20 ms
+  setup["/fx/1/par/02"]       = [0.64]       # default: FX1 DECAY 1.57 s
+  setup["/fx/1/par/03"]       = [0.59183675] # default: FX1 SIZE 60
+  setup["/fx/1/par/04"]       = [0.58333333] # default: FX1 DAMP 5k74 Hz
+  setup["/fx/1/par/05"]       = [0.82758623] # default: FX1 DIFF 25
+  setup["/fx/1/par/06"]       = [0.5]        # default: FX1 LEVEL 0 dB
+  setup["/fx/2/type"]         = [3]          # default: FX2 Room Reverb (for drums)
+  setup["/fx/2/par/01"]       = [0.03]       # default: FX2 PRE DEL 6 ms
+  setup["/fx/2/par/02"]       = [0.08]       # default: FX2 DECAY 0.43 s
+  setup["/fx/2/par/03"]       = [0.19444444] # default: FX2 SIZE 18 m
+  setup["/fx/2/par/04"]       = [0.45833334] # default: FX2 DAMP 3k94 Hz
+  setup["/fx/2/par/05"]       = [0.68]       # default: FX2 DIFF 68 %
+  setup["/fx/2/par/06"]       = [0.5]        # default: FX2 LEVEL 0 dB
+  setup["/rtn/1/mix/fader"]   = [0.74975562] # default:   0 dB return level for FX1 (vocal)
+  setup["/rtn/2/mix/fader"]   = [0.74975562] # default:   0 dB return level for FX2 (drums)
+  setup["/rtn/3/mix/fader"]   = [0]          # default: -90 dB return level for FX3 (not used)
+  setup["/rtn/4/mix/fader"]   = [0]          # default: -90 dB return level for FX4 (not used)
+  setup["/config/solo/source"] = [14]        # default: monitor source BUS 5/6 (monitor Volker)
+  setup["/lr/eq/on"]          = [0]          # default: master EQ off
+  setup["/lr/eq/mode"]        = [0]          # default: PEQ for master EQ, needed for feedback cancellation
+  for i in range(6):
+    setup[f"/lr/eq/{i + 1}/g"] = [0.5]       # default: master EQ Gain 0 dB
+  return setup
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+
+#*******************************************************************************
+# Copyright (c) 2024-2024
+# Author(s): Volker Fischer
+#*******************************************************************************
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA
+#*******************************************************************************
+
+# Benchmarks of the meter processing hot paths (decode, histograms, feedback detection, RTA
+# history, meter log, engine receive path, GUI view), no mixer connection or display needed. Each
+# benchmark is driven frame by frame with synthetic (mockmixer.py) or recorded meter blobs, reports
+# frames per second and per frame latency percentiles and, in a separate pass with tracemalloc,
+# the allocations. The results can be written to a JSON file to compare runs across versions.
+# usage: python3 benchmark.py [--frames 5000] [--json results.json]
+#        python3 benchmark.py --log meters.xrl --only decode histograms
+
+import argparse, json, os, platform, struct, sys, tempfile, time, tracemalloc, numpy
+from meters import decode_meter_blob, LevelHistograms, FeedbackDetector, RtaHistory
+from mockmixer import meter_sizes, meter_period_s, meter_blob, SyntheticMeters, RecordedMeters
+from osccodec import OscMessage
+import meterlog
+
+hist_len     = 128 # same as in xairautomix.py
+num_inputs   = 18
+percentiles  = [50, 90, 99]
+warmup       = 50  # frames before the measurement
+pad_values   = {"/meters/2": -128 * 256, "/meters/4": -128 * 256, "/meters/6": 0}
+log_dir      = None # meter log files of the benchmark, removed at the end
+
+
+def decode_meter_blob_loop(blob):
+  # reference: per value decoding as previously done in receive_meter_messages
+  data = bytearray(blob)
+  size = struct.unpack('i', data[:4])[0]
+  (values, raw_values) = ([0] * size, [0] * size)
+  for i in range(size):
+    raw_values[i] = struct.unpack('h', data[4 + i * 2:4 + i * 2 + 2])[0]
+    values[i]     = raw_values[i] / 256
+  return (raw_values, values)
+
+
+def make_frames(num_frames, meters):
+  # (/meters/2, /meters/4, /meters/6) blobs with the sizes sent by the mixer
+  frames = []
+  for _ in range(num_frames):
+    blobs = []
+    for ((address, size), values) in zip(meter_sizes.items(), meters.next_frame()):
+      padded = numpy.full(size, pad_values[address], dtype=numpy.int16)
+      padded[:min(size, len(values))] = values[:size]
+      blobs.append(meter_blob(padded))
+    frames.append(tuple(blobs))
+  return frames
+
+
+class NullMixer:
+  # the engine only sends to the mixer, nothing is answered
+  db_to_float = freq_to_float = q_to_float = staticmethod(lambda x: 0.5)
+
+  def set_value(self, address, values, readback=True):
+    pass
+
+
+def decode_loop(frames):
+  return lambda i: [decode_meter_blob_loop(blob) for blob in frames[i]]
+
+
+def decode(frames):
+  for blobs in frames[:10]: # both decoders must give identical results
+    for blob in blobs:
+      assert list(decode_meter_blob(blob)[1]) == decode_meter_blob_loop(blob)[1]
+  return lambda i: [decode_meter_blob(blob) for blob in frames[i]]
+
+
+def histograms(frames):
+  inputs = [decode_meter_blob(f[0])[1][:num_inputs] for f in frames]
+  state  = LevelHistograms(num_inputs, hist_len, meter_period_s)
+  return lambda i: state.add(inputs[i])
+
+
+def feedback(frames):
+  rtas     = [decode_meter_blob(f[1])[1] for f in frames]
+  detector = FeedbackDetector(meter_sizes["/meters/4"], 30, 10)
+  return lambda i: detector.update(rtas[i])
+
+
+def rta_history(frames):
+  rtas    = [decode_meter_blob(f[1])[1] for f in frames]
+  history = RtaHistory(meter_sizes["/meters/4"], meter_period_s)
+  return lambda i: history.add(rtas[i], i * meter_period_s)
+
+
+def meter_log(frames):
+  # one record per frame, the file is appended every second as in xairautomix.py
+  raw    = [tuple(decode_meter_blob(blob)[0] for blob in f) for f in frames]
+  path   = os.path.join(tempfile.mkdtemp(dir=log_dir), "benchmark.xrl")
+  writer = meterlog.MeterLogWriter(path, num_inputs, meter_sizes["/meters/4"], meter_sizes["/meters/6"])
+  frames_per_s = round(1 / meter_period_s)
+  def step(i):
+    writer.add(i * meter_period_s, raw[i][0][:num_inputs], raw[i][1], raw[i][2])
+    if i % frames_per_s == frames_per_s - 1:
+      writer.flush()
+  return step
+
+
+def new_engine():
+  import xairautomix # needs python-x32, see the git submodule
+  xairautomix.metrics.enabled = False
+  engine = xairautomix.AutoMixEngine(NullMixer(), log_meters=False)
+  engine.do_feedback_cancel = True
+  return (xairautomix, engine)
+
+
+def engine_receive(frames):
+  # dispatch of the three meter messages including decoding, state update and feedback detection
+  (_, engine) = new_engine()
+  messages    = [[OscMessage(address, [blob]) for (address, blob) in zip(meter_sizes, f)] for f in frames]
+  def step(i):
+    for message in messages[i]:
+      engine.dispatcher.dispatch(message)
+    while not engine.rta_queue.empty():
+      engine.detect_feedback(engine.rta_queue.get_nowait())
+  return step
+
+
+def gui_view(frames):
+  # snapshot and everything the GUI redraw computes, without the Tk widget updates
+  (xairautomix, engine) = new_engine()
+  for f in frames[:200]:
+    for (address, blob) in zip(meter_sizes, f):
+      engine.dispatcher.dispatch(OscMessage(address, [blob]))
+  return lambda i: xairautomix.gui_view(engine.snapshot(xairautomix.hist_gui_window_s), 0)
+
+
+benchmarks = {"decode_loop": decode_loop, "decode": decode, "histograms": histograms, "feedback": feedback,
+              "rta_history": rta_history, "meter_log": meter_log, "engine_receive": engine_receive,
+              "gui_view": gui_view}
+
+
+def run_timed(setup, frames):
+  step  = setup(frames)
+  count = len(frames)
+  for i in range(min(warmup, count)):
+    step(i)
+  times = numpy.zeros(count, dtype=numpy.int64)
+  for i in range(count):
+    start    = time.perf_counter_ns()
+    step(i)
+    times[i] = time.perf_counter_ns() - start
+  times_us = times / 1000
+  result   = {"frames": count, "fps": count / (times.sum() / 1e9), "mean_us": float(times_us.mean()),
+              "max_us": float(times_us.max())}
+  for p in percentiles:
+    result[f"p{p}_us"] = float(numpy.percentile(times_us, p))
+  return result
+
+
+def run_allocations(setup, frames):
+  # fresh state, only the frame steps are traced
+  step = setup(frames)
+  for i in range(min(warmup, len(frames))):
+    step(i)
+  tracemalloc.start()
+  try:
+    (before, _) = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    snapshot = tracemalloc.take_snapshot()
+    for i in range(len(frames)):
+      step(i)
+    (after, peak) = tracemalloc.get_traced_memory()
+    blocks = sum(s.count_diff for s in tracemalloc.take_snapshot().compare_to(snapshot, "filename"))
+  finally:
+    tracemalloc.stop()
+  return {"alloc_peak_bytes": peak - before, "alloc_retained_bytes_per_frame": (after - before) / len(frames),
+          "alloc_retained_blocks": blocks}
+
+
+def main():
+  global log_dir
+  parser = argparse.ArgumentParser(description="Benchmarks of the meter processing, no mixer needed")
+  parser.add_argument("--frames", type=int, default=5000, help="meter frames per benchmark")
+  parser.add_argument("--seed", type=int, default=1, help="seed of the synthetic meters")
+  parser.add_argument("--log", help="recorded meter log (meterlog.py) instead of synthetic meters")
+  parser.add_argument("--raw", help="legacy raw log (18 int16 input values per frame) instead of synthetic meters")
+  parser.add_argument("--only", nargs="+", choices=benchmarks, help="run only these benchmarks")
+  parser.add_argument("--no-alloc", action="store_true", help="skip the allocation pass")
+  parser.add_argument("--json", help="write the results to this file")
+  args = parser.parse_args()
+
+  if args.log or args.raw:
+    (meters, source) = (RecordedMeters(args.log or args.raw, raw=bool(args.raw)), args.log or args.raw)
+  else:
+    (meters, source) = (SyntheticMeters(args.seed), f"synthetic, seed {args.seed}")
+  frames  = make_frames(args.frames + warmup, meters)
+  results = {}
+  print(f"{args.frames} meter frames ({source}), latencies in us per frame")
+  print(f"  {'':16}{'fps':>10}{'mean':>9}" + "".join(f"{f'p{p}':>9}" for p in percentiles) +
+        f"{'max':>9}" + (f"{'peak kB':>10}{'B/frame':>10}" if not args.no_alloc else ""))
+  with tempfile.TemporaryDirectory() as log_dir:
+    for name in args.only or benchmarks:
+      setup = benchmarks[name]
+      try:
+        result = run_timed(setup, frames[warmup:])
+      except ImportError as e:
+        results[name] = {"skipped": str(e)}
+        print(f"  {name:16}skipped: {e}")
+        continue
+      if not args.no_alloc:
+        result.update(run_allocations(setup, frames[warmup:]))
+      results[name] = result
+      alloc = f"{result['alloc_peak_bytes'] / 1000:10.1f}{result['alloc_retained_bytes_per_frame']:10.1f}" \
+              if not args.no_alloc else ""
+      print(f"  {name:16}{result['fps']:10.0f}{result['mean_us']:9.1f}" +
+            "".join(f"{result[f'p{p}_us']:9.1f}" for p in percentiles) + f"{result['max_us']:9.1f}" + alloc)
+  if "decode_loop" in results and "decode" in results and "fps" in results["decode"]:
+    print(f"  decode speedup {results['decode_loop']['mean_us'] / results['decode']['mean_us']:.1f}x")
+
+  if args.json:
+    with open(args.json, "w") as file:
+      json.dump({"time": time.strftime("%Y-%m-%dT%H:%M:%S%z"), "source": source, "frames": args.frames,
+                 "python": sys.version.split()[0], "numpy": numpy.__version__, "platform": platform.platform(),
+                 "machine": platform.machine(), "results": results}, file, indent=2)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,138 @@
+#*******************************************************************************
+# Copyright (c) 2024-2024
+# Author(s): Volker Fischer
+#*******************************************************************************
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA
+#*******************************************************************************
+
+# Meter log file format:
+# - header of header_size bytes: fixed header (header_dtype) followed by JSON with the channel names
+# - fixed size records, one per /meters/2 frame: time stamp, bit mask of the streams which were
+#   updated since the previous record, raw int16 values of inputs (/meters/2), RTA (/meters/4) and
+#   dyn (/meters/6), value in dB = raw value * scale
+# - the records are grouped in chunks of chunk_frames records, the start time of each chunk is
+#   appended to the index file (log file name + ".idx") so that a time can be found without reading
+#   the records, a missing index (e.g. after a crash) is rebuilt from the record time stamps
+
+import json, os, numpy
+
+magic       = b"XRMLOG01"
+header_size = 4096 # records start page aligned for memory mapping
+header_dtype = numpy.dtype([("magic", "S8"), ("version", "<u2"), ("scale", "<f4"), ("len_inputs", "<u2"),
+                            ("len_rta", "<u2"), ("len_dyn", "<u2"), ("chunk_frames", "<u4"),
+                            ("frame_period_s", "<f4"), ("start_time", "<f8")])
+fresh_inputs = 1 # bits of the record "fresh" field
+fresh_rta    = 2
+fresh_dyn    = 4
+
+
+def record_dtype(len_inputs, len_rta, len_dyn):
+  return numpy.dtype([("time", "<f8"), ("fresh", "u1"), ("reserved", "u1"), ("inputs", "<i2", (len_inputs,)),
+                      ("rta", "<i2", (len_rta,)), ("dyn", "<i2", (len_dyn,))])
+
+
+class MeterLogWriter:
+  # one persistent buffered file, records are collected in a preallocated chunk buffer
+  def __init__(self, path, len_inputs, len_rta, len_dyn, channel_names=[], chunk_frames=1200,
+               frame_period_s=0.05, start_time=0):
+    self.path         = path
+    self.dtype        = record_dtype(len_inputs, len_rta, len_dyn)
+    self.chunk        = numpy.zeros(chunk_frames, dtype=self.dtype)
+    self.chunk_fill   = 0 # records in the chunk buffer
+    self.chunk_stored = 0 # records of the chunk buffer which are already written to the file
+    self.file         = open(path, "wb")
+    self.index_file   = open(path + ".idx", "wb")
+    header = numpy.zeros(1, dtype=header_dtype)
+    header[0] = (magic, 1, 1 / 256, len_inputs, len_rta, len_dyn, chunk_frames, frame_period_s, start_time)
+    header_bytes = header.tobytes() + json.dumps({"channel_names": channel_names}).encode()
+    if len(header_bytes) > header_size:
+      raise ValueError("meter log header too large")
+    self.file.write(header_bytes.ljust(header_size, b"\0"))
+
+  def add(self, time, inputs, rta, dyn, fresh=fresh_inputs):
+    record = self.chunk[self.chunk_fill]
+    record["time"]  = time
+    record["fresh"] = fresh
+    for (name, values) in (("inputs", inputs), ("rta", rta), ("dyn", dyn)):
+      n = min(len(values), len(record[name]))
+      record[name][:n] = values[:n]
+      record[name][n:] = 0
+    if self.chunk_fill == 0: # new chunk
+      self.index_file.write(numpy.float64(time).tobytes())
+    self.chunk_fill += 1
+    if self.chunk_fill == len(self.chunk):
+      self.flush()
+      (self.chunk_fill, self.chunk_stored) = (0, 0)
+
+  def flush(self):
+    self.file.write(self.chunk[self.chunk_stored:self.chunk_fill].tobytes())
+    self.chunk_stored = self.chunk_fill
+    self.file.flush()
+    self.index_file.flush()
+
+  def close(self):
+    self.flush()
+    self.file.close()
+    self.index_file.close()
+
+
+class MeterLog:
+  # read access to a meter log, the records are memory mapped (nothing is read on open)
+  def __init__(self, path):
+    header = numpy.fromfile(path, dtype=header_dtype, count=1)
+    if len(header) == 0 or header[0]["magic"] != magic:
+      raise ValueError(f"{path} is not a meter log file")
+    header              = header[0]
+    self.scale          = float(header["scale"])
+    self.chunk_frames   = int(header["chunk_frames"])
+    self.frame_period_s = float(header["frame_period_s"])
+    self.start_time     = float(header["start_time"])
+    self.dtype          = record_dtype(int(header["len_inputs"]), int(header["len_rta"]), int(header["len_dyn"]))
+    with open(path, "rb") as file:
+      file.seek(header_dtype.itemsize)
+      self.channel_names = json.loads(file.read(header_size - header_dtype.itemsize).rstrip(b"\0"))["channel_names"]
+    num_records = max(0, (os.path.getsize(path) - header_size) // self.dtype.itemsize)
+    if num_records > 0:
+      self.records = numpy.memmap(path, dtype=self.dtype, mode="r", offset=header_size, shape=(num_records,))
+    else:
+      self.records = numpy.zeros(0, dtype=self.dtype)
+    num_chunks = -(-num_records // self.chunk_frames)
+    index = numpy.fromfile(path + ".idx", dtype="<f8") if os.path.exists(path + ".idx") else []
+    if len(index) >= num_chunks:
+      self.index = numpy.asarray(index[:num_chunks])
+    else: # no or incomplete index: only read the first record time of each chunk
+      self.index = numpy.array(self.records["time"][::self.chunk_frames])
+
+  def __len__(self):
+    return len(self.records)
+
+  def seek(self, time):
+    # record number of the first record at or after the given time
+    chunk = max(0, numpy.searchsorted(self.index, time, side="right") - 1)
+    times = self.records["time"][chunk * self.chunk_frames:(chunk + 1) * self.chunk_frames]
+    return chunk * self.chunk_frames + int(numpy.searchsorted(times, time))
+
+  def frames(self, start_time=None, end_time=None):
+    start = 0 if start_time is None else self.seek(start_time)
+    end   = len(self.records) if end_time is None else self.seek(end_time)
+    return self.records[start:end]
+
+  def chunks(self, start=0, end=None, chunk_frames=None):
+    # memory mapped slices, only one chunk is touched at a time
+    chunk_frames = chunk_frames or self.chunk_frames
+    end = len(self.records) if end is None else end
+    for i in range(start, end, chunk_frames):
+      yield self.records[i:min(end, i + chunk_frames)]
+
+  def to_db(self, raw_values):
+    return raw_values * numpy.float32(self.scale)
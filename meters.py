@@ -0,0 +1,266 @@
+#*******************************************************************************
+# Copyright (c) 2024-2024
+# Author(s): Volker Fischer
+#*******************************************************************************
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA
+#*******************************************************************************
+
+# Meter data processing for the X-AIR /meters messages. Only depends on numpy so
+# that it can be used without a mixer connection (benchmarks, analysis tools).
+
+import numpy
+
+meter_scale      = numpy.float32(1 / 256) # resolution of the meter values is 1/256 dB
+decay_min_weight = 0.01 # decaying histogram bins below this share of the weight of a bin which is hit in every
+                        # frame count as empty: a level drops out at the latest after ln(100) = 4.6 time constants,
+                        # levels which are present for less than 1 % of the time constant are ignored
+
+
+def decode_meter_blob(blob):
+  # blob layout: int32 number of values followed by signed 16 bit values (little endian),
+  # the raw values are a view on the blob (no copy), the dB values are one float32 array
+  if len(blob) < 4:
+    return (None, None)
+  size = int(numpy.frombuffer(blob, dtype="<i4", count=1)[0])
+  size = max(0, min(size, (len(blob) - 4) // 2)) # do not trust the size field beyond the blob length
+  raw_values = numpy.frombuffer(blob, dtype="<i2", count=size, offset=4)
+  return (raw_values, raw_values * meter_scale)
+
+
+def rta_frequency(index, num_bins=100):
+  # center frequency in Hz of an RTA bin, 20 Hz..20 kHz logarithmic (inverse of mixer.freq_to_float)
+  return numpy.exp(index / num_bins * numpy.log(20000 / 20)) * 20
+
+
+def level_bins(values, hist_len):
+  # histogram bin of each level, levels -128..0 dB are mapped on bins 0..hist_len
+  return numpy.clip(numpy.round((numpy.asarray(values) + 128) / 128 * hist_len), 0, hist_len - 1).astype(numpy.intp)
+
+
+class LevelHistograms:
+  # per channel level histograms, one vectorized update per meter frame, three ways to look back:
+  # - since the last reset (always available)
+  # - over the last N seconds: ring buffer of cumulative histograms taken at each window start,
+  #   the histogram of the current plus the last N windows is the difference of two cumulative histograms
+  # - exponentially decaying (decay_s set): each frame is weighted higher than the previous one,
+  #   the weights are re-normalized before they overflow
+  def __init__(self, num_channels, hist_len, frame_period_s=0.05, window_s=10, history_s=1800, decay_s=None):
+    self.num_channels   = num_channels
+    self.hist_len       = hist_len
+    self.window_s       = window_s
+    self.window_frames  = max(1, round(window_s / frame_period_s))
+    self.num_windows    = max(1, int(numpy.ceil(history_s / window_s)))
+    self.decay_factor   = numpy.exp(frame_period_s / decay_s) if decay_s else None
+    self.full_weight    = 1 / (1 - 1 / self.decay_factor) if decay_s else None # bin hit in every frame
+    self.channels       = numpy.arange(num_channels)
+    self.reset()
+
+  def reset(self, ch=None):
+    if ch is None:
+      self.total         = numpy.zeros((self.num_channels, self.hist_len), dtype=numpy.int64)
+      self.window_starts = numpy.zeros((self.num_windows + 1, self.num_channels, self.hist_len), dtype=numpy.int64)
+      self.window_index  = 0 # index of the current (partial) window since reset
+      self.window_fill   = 0 # frames in the current window
+      self.decayed       = numpy.zeros((self.num_channels, self.hist_len))
+      self.weight        = 1.0
+    else: # only one channel, the time base stays the same for all channels
+      self.total[ch]            = 0
+      self.window_starts[:, ch] = 0
+      self.decayed[ch]          = 0
+
+  def add(self, values):
+    bins = level_bins(values, self.hist_len)
+    self.total[self.channels[:len(bins)], bins] += 1
+    if self.decay_factor is not None:
+      self.weight *= self.decay_factor
+      if self.weight > 1e100:
+        self.decayed /= self.weight
+        self.weight   = 1.0
+      self.decayed[self.channels[:len(bins)], bins] += self.weight
+    self.window_fill += 1
+    if self.window_fill >= self.window_frames: # start a new window: O(bins) once per window
+      self.window_fill   = 0
+      self.window_index += 1
+      self.window_starts[self.window_index % (self.num_windows + 1)] = self.total
+
+  def histogram(self, window_s=None):
+    # counts of the current window plus enough full windows to cover window_s seconds, None: since reset
+    if window_s is None:
+      return self.total
+    num_windows  = min(self.num_windows, max(1, int(numpy.ceil(window_s / self.window_s))))
+    first_window = self.window_index - num_windows
+    if first_window <= 0:
+      return self.total
+    return self.total - self.window_starts[first_window % (self.num_windows + 1)]
+
+  def decaying_histogram(self):
+    return self.decayed / self.weight
+
+  def max_levels(self, window_s=None, decayed=False):
+    # highest level in dB per channel which was seen in the time window (decayed: recently enough
+    # for the decaying histogram), -128 if no data
+    used    = self.decaying_histogram() >= decay_min_weight * self.full_weight if decayed else \
+              self.histogram(window_s) > 0
+    highest = self.hist_len - 1 - numpy.argmax(used[:, ::-1], axis=1)
+    return numpy.where(used.any(axis=1), highest / self.hist_len * 128 - 128, -128)
+
+
+class FeedbackDetector:
+  # all narrow RTA peaks of a frame in one vectorized pass: a bin is a peak if it is a local maximum
+  # and threshold_dB above both bins at distance two, feedback is a peak which persists in the same
+  # bin for min_count consecutive frames
+  def __init__(self, num_bins, threshold_dB, min_count):
+    self.threshold_dB = threshold_dB
+    self.min_count    = min_count
+    self.counts       = numpy.zeros(num_bins, dtype=numpy.int32)
+    self.peaks        = numpy.zeros(num_bins, dtype=bool)
+
+  def reset(self):
+    self.counts[:] = 0
+
+  def update(self, rta):
+    # returns the bins with detected feedback, their counters start again at zero
+    rta    = numpy.asarray(rta)
+    center = rta[2:-2]
+    self.peaks[2:-2] = (center - rta[:-4] > self.threshold_dB) & (center - rta[4:] > self.threshold_dB) & \
+                       (center >= rta[1:-3]) & (center >= rta[3:-1])
+    self.counts += 1
+    self.counts[~self.peaks] = 0
+    detected = numpy.flatnonzero(self.counts >= self.min_count)
+    self.counts[detected] = 0
+    return detected
+
+
+class RtaTier:
+  # decimated spectrogram: max and mean of each decimation frames (or rows of the finer tier) in
+  # ring buffers, plus the cumulative sum of the mean rows for constant time window means
+  def __init__(self, num_bins, period_s, num_rows, decimation):
+    self.period_s   = period_s
+    self.num_rows   = num_rows
+    self.decimation = decimation
+    self.max        = numpy.full((num_rows, num_bins), -128, dtype=numpy.float32)
+    self.mean       = numpy.full((num_rows, num_bins), -128, dtype=numpy.float32)
+    self.cumulative = numpy.zeros((num_rows + 1, num_bins)) # float64, cumulative[n % (num_rows + 1)]: sum of n rows
+    self.total      = numpy.zeros(num_bins)
+    self.rows       = 0 # completed rows since start
+    self.acc_max    = numpy.full(num_bins, -128, dtype=numpy.float32)
+    self.acc_sum    = numpy.zeros(num_bins, dtype=numpy.float32)
+    self.acc_fill   = 0
+
+  def add(self, max_values, mean_values):
+    # returns True if a row was completed
+    numpy.maximum(self.acc_max, max_values, out=self.acc_max)
+    self.acc_sum  += mean_values
+    self.acc_fill += 1
+    if self.acc_fill < self.decimation:
+      return False
+    row = self.rows % self.num_rows
+    self.max[row]  = self.acc_max
+    self.mean[row] = self.acc_sum / self.acc_fill
+    self.total    += self.mean[row]
+    self.rows     += 1
+    self.cumulative[self.rows % (self.num_rows + 1)] = self.total
+    self.acc_max[:] = -128
+    self.acc_sum[:] = 0
+    self.acc_fill   = 0
+    return True
+
+  def window_rows(self, window_s):
+    return max(1, min(self.rows, self.num_rows, round(window_s / self.period_s)))
+
+  def rows_of(self, data, window_s):
+    # the last rows covering window_s, oldest first (copy)
+    n   = self.window_rows(window_s) if self.rows else 0
+    idx = numpy.arange(self.rows - n, self.rows) % self.num_rows
+    return data[idx]
+
+  def window_mean(self, window_s):
+    n = self.window_rows(window_s)
+    return (self.cumulative[self.rows % (self.num_rows + 1)] - self.cumulative[(self.rows - n) % (self.num_rows + 1)]) / n
+
+
+class RtaHistory:
+  # bounded in-memory spectrogram of the RTA stream: the full rate frames of the last full_rate_s
+  # seconds and decimated tiers (period_s, history_s), e.g. 1 s rows for an hour and 10 s rows for six
+  # hours, each tier is computed from the rows of the previous one, the memory is fixed on creation;
+  # window lengths are counted in rows, i.e. lost frames make a window a little longer in time
+  def __init__(self, num_bins, frame_period_s=0.05, full_rate_s=60, tiers=((1, 3600), (10, 6 * 3600))):
+    self.num_bins       = num_bins
+    self.frame_period_s = frame_period_s
+    self.full_rows      = max(1, round(full_rate_s / frame_period_s))
+    self.frames         = numpy.full((self.full_rows, num_bins), -128, dtype=numpy.float32)
+    self.times          = numpy.zeros(self.full_rows)
+    self.num_frames     = 0
+    self.tiers          = []
+    previous_s          = frame_period_s
+    for (period_s, history_s) in tiers:
+      decimation = max(1, round(period_s / previous_s))
+      self.tiers.append(RtaTier(num_bins, decimation * previous_s, max(1, round(history_s / period_s)), decimation))
+      previous_s = decimation * previous_s
+
+  def add(self, rta, time=0.0):
+    row = self.num_frames % self.full_rows
+    self.frames[row] = rta
+    self.times[row]  = time
+    self.num_frames += 1
+    (max_values, mean_values) = (self.frames[row], self.frames[row])
+    for tier in self.tiers: # a tier gets a new row only if the finer one completed one
+      if not tier.add(max_values, mean_values):
+        break
+      (max_values, mean_values) = (tier.max[(tier.rows - 1) % tier.num_rows], tier.mean[(tier.rows - 1) % tier.num_rows])
+
+  def recent(self, window_s):
+    # full rate frames and their times of the last window_s seconds, oldest first
+    n   = min(self.num_frames, self.full_rows, max(1, round(window_s / self.frame_period_s)))
+    idx = numpy.arange(self.num_frames - n, self.num_frames) % self.full_rows
+    return (self.frames[idx], self.times[idx])
+
+  def tier_for(self, window_s):
+    # finest tier which covers the window, the coarsest one if none does
+    for tier in self.tiers:
+      if tier.num_rows * tier.period_s >= window_s:
+        return tier
+    return self.tiers[-1]
+
+  def mean_spectrum(self, window_s):
+    # mean level per bin over the last window_s seconds, independent of the window length
+    tier = self.tier_for(window_s)
+    if tier.rows == 0: # less than one row of the tier: use the full rate frames
+      return self.recent(window_s)[0].mean(axis=0) if self.num_frames else numpy.full(self.num_bins, -128.0)
+    return tier.window_mean(window_s)
+
+  def covered_s(self, window_s):
+    # time span of the data which mean_spectrum and max_spectrum use for the window
+    tier = self.tier_for(window_s)
+    if tier.rows == 0:
+      return min(self.num_frames, self.full_rows, max(1, round(window_s / self.frame_period_s))) * self.frame_period_s
+    return tier.window_rows(window_s) * tier.period_s
+
+  def max_spectrum(self, window_s):
+    tier = self.tier_for(window_s)
+    if tier.rows == 0:
+      return self.recent(window_s)[0].max(axis=0) if self.num_frames else numpy.full(self.num_bins, -128.0)
+    return tier.rows_of(tier.max, window_s).max(axis=0)
+
+  def persistent_bins(self, window_s, count=5, min_prominence_dB=6, min_history_s=10):
+    # bins which stand out of their neighborhood (+-2 bins, same as FeedbackDetector) in the mean
+    # spectrum of the window, i.e. frequencies which ring over a long time: (bins, mean dB, prominence dB),
+    # none before the window holds min_history_s (a mean of a few frames has noise peaks)
+    if self.covered_s(window_s) < min(window_s, min_history_s) - 1e-9:
+      return (numpy.zeros(0, dtype=numpy.int64), numpy.zeros(0, dtype=numpy.float32), numpy.zeros(0))
+    mean       = self.mean_spectrum(window_s)
+    prominence = numpy.full(self.num_bins, -numpy.inf)
+    prominence[2:-2] = mean[2:-2] - numpy.maximum(numpy.maximum(mean[:-4], mean[4:]), numpy.maximum(mean[1:-3], mean[3:-1]))
+    bins = numpy.argsort(prominence)[::-1][:count]
+    bins = bins[prominence[bins] >= min_prominence_dB]
+    return (bins, mean[bins], prominence[bins])
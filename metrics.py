@@ -0,0 +1,182 @@
+#*******************************************************************************
+# Copyright (c) 2024-2024
+# Author(s): Volker Fischer
+#*******************************************************************************
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA
+#*******************************************************************************
+
+# Latency histograms, counters and lock wait times of the processing stages. When disabled, a
+# stage measurement is one attribute check and a shared no-op context manager. The data can be
+# written periodically to a JSON file and/or served in Prometheus text format via HTTP.
+
+import json, os, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+num_buckets = 24 # latency buckets: < 1 us, < 2 us, < 4 us, ... < 8.4 s, the last one is open
+
+
+class LatencyHistogram:
+  def __init__(self):
+    self.buckets = [0] * num_buckets
+    self.count   = 0
+    self.sum_s   = 0.0
+    self.max_s   = 0.0
+
+  def add(self, seconds):
+    self.buckets[min(num_buckets - 1, int(seconds * 1e6).bit_length())] += 1
+    self.count += 1
+    self.sum_s += seconds
+    self.max_s  = max(self.max_s, seconds)
+
+  def percentile(self, p):
+    # upper bucket limit in seconds which contains the p percent point
+    (limit, total) = (p / 100 * self.count, 0)
+    for (i, n) in enumerate(self.buckets):
+      total += n
+      if total >= limit and n > 0:
+        return bucket_limit_s(i)
+    return 0.0
+
+
+def bucket_limit_s(i):
+  return (1 << i) * 1e-6
+
+
+class NoTimer:
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *args):
+    return False
+
+
+class StageTimer:
+  def __init__(self, metrics, name):
+    (self.metrics, self.name) = (metrics, name)
+
+  def __enter__(self):
+    self.start = time.perf_counter()
+    return self
+
+  def __exit__(self, *args):
+    self.metrics.record(self.name, time.perf_counter() - self.start)
+    return False
+
+
+class TimedLock:
+  # acquires the lock and records the time spent waiting for it
+  def __init__(self, metrics, lock, name):
+    (self.metrics, self.lock, self.name) = (metrics, lock, name)
+
+  def __enter__(self):
+    start = time.perf_counter()
+    self.lock.acquire()
+    self.metrics.record(self.name, time.perf_counter() - start)
+    return self
+
+  def __exit__(self, *args):
+    self.lock.release()
+    return False
+
+
+no_timer = NoTimer()
+
+
+class Metrics:
+  def __init__(self, enabled=False):
+    self.enabled    = enabled
+    self.latencies  = {} # stage name -> LatencyHistogram
+    self.counters   = {} # name -> count
+    self.sources    = {} # name -> function returning a dict of additional values (e.g. queue depths)
+    self.mutex      = threading.Lock()
+    self.start_time = time.monotonic()
+
+  def stage(self, name):
+    return StageTimer(self, name) if self.enabled else no_timer
+
+  def lock(self, lock, name):
+    return TimedLock(self, lock, "lock_wait_" + name) if self.enabled else lock
+
+  def record(self, name, seconds):
+    with self.mutex:
+      if name not in self.latencies:
+        self.latencies[name] = LatencyHistogram()
+      self.latencies[name].add(seconds)
+
+  def count(self, name, n=1):
+    if self.enabled:
+      with self.mutex:
+        self.counters[name] = self.counters.get(name, 0) + n
+
+  def add_source(self, name, function):
+    self.sources[name] = function
+
+  def snapshot(self):
+    with self.mutex:
+      uptime_s = time.monotonic() - self.start_time
+      result   = {"uptime_s": uptime_s, "counters": dict(self.counters),
+                  "rates_per_s": {name: n / uptime_s for (name, n) in self.counters.items()},
+                  "latencies": {name: {"count": h.count, "mean_s": h.sum_s / h.count if h.count else 0,
+                                       "max_s": h.max_s, "p50_s": h.percentile(50), "p99_s": h.percentile(99)}
+                                for (name, h) in self.latencies.items()}}
+    for (name, function) in self.sources.items():
+      result[name] = function()
+    return result
+
+  def prometheus(self):
+    lines = []
+    with self.mutex:
+      for (name, n) in self.counters.items():
+        lines.append(f'xairautomix_events_total{{name="{name}"}} {n}')
+      for (name, h) in self.latencies.items():
+        total = 0
+        for (i, n) in enumerate(h.buckets[:-1]):
+          total += n
+          lines.append(f'xairautomix_latency_seconds_bucket{{stage="{name}",le="{bucket_limit_s(i):g}"}} {total}')
+        lines.append(f'xairautomix_latency_seconds_bucket{{stage="{name}",le="+Inf"}} {h.count}')
+        lines.append(f'xairautomix_latency_seconds_sum{{stage="{name}"}} {h.sum_s}')
+        lines.append(f'xairautomix_latency_seconds_count{{stage="{name}"}} {h.count}')
+    for (source, function) in self.sources.items(): # nested dicts of numbers become gauges
+      for (key, values) in function().items():
+        for (field, value) in (values.items() if isinstance(values, dict) else [("value", values)]):
+          lines.append(f'xairautomix_{source}{{key="{key}",field="{field}"}} {value}')
+    return "\n".join(lines) + "\n"
+
+  def start_export(self, file_path=None, port=None, period_s=5):
+    # periodic JSON file and/or HTTP endpoint (GET /metrics: Prometheus text, other paths: JSON)
+    if file_path:
+      def write_file():
+        while True:
+          time.sleep(period_s)
+          with open(file_path + ".tmp", "w") as file:
+            json.dump(self.snapshot(), file, indent=2)
+          os.replace(file_path + ".tmp", file_path) # readers never see a half written file
+      threading.Thread(target=write_file, daemon=True).start()
+    if port:
+      metrics = self
+      class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+          if self.path == "/metrics":
+            (body, content_type) = (metrics.prometheus(), "text/plain; version=0.0.4")
+          else:
+            (body, content_type) = (json.dumps(metrics.snapshot(), indent=2), "application/json")
+          self.send_response(200)
+          self.send_header("Content-Type", content_type)
+          self.end_headers()
+          self.wfile.write(body.encode())
+
+        def log_message(self, *args):
+          pass
+      server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+      threading.Thread(target=server.serve_forever, daemon=True).start()
+
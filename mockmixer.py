@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+
+#*******************************************************************************
+# Copyright (c) 2024-2024
+# Author(s): Volker Fischer
+#*******************************************************************************
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA
+#*******************************************************************************
+
+# Stand-in for a X-AIR mixer on the local machine for testing without hardware: answers /info and
+# /xinfo, keeps a parameter tree (set, query, /xremote pushes) and streams /meters/2, /meters/4 and
+# /meters/6 from a recorded meter log or a synthetic generator at real-time or N times speed.
+# usage: python3 mockmixer.py [--log meters.xrl | --raw _test.dat] [--speed 10]
+#        python3 xairautomix.py 127.0.0.1
+
+import argparse, socket, struct, threading, time, numpy
+from osccodec import encode_message, decode_message
+import meterlog
+
+meter_sizes       = {"/meters/2": 36, "/meters/4": 100, "/meters/6": 39} # values per blob as sent by the mixer
+meter_period_s    = 0.05 # the mixer sends the meters every 50 ms
+subscription_s    = 10   # /meters and /xremote subscriptions time out after 10 s
+firmware_version  = "1.17"
+
+
+def default_value(address):
+  # value of parameters which were never set, gains and pans are in their middle position (0 dB, center)
+  if address.endswith("/name"):
+    return [""]
+  if address.endswith("/g") or address.endswith("/pan"):
+    return [0.5]
+  return [0.0]
+
+
+def meter_blob(values):
+  return struct.pack("<i", len(values)) + numpy.asarray(values, dtype="<i2").tobytes()
+
+
+class SyntheticMeters:
+  # random walk input levels with short silent phases, pink-ish RTA noise floor and from time to
+  # time a narrow peak which looks like feedback
+  def __init__(self, seed=1, feedback_every_s=20):
+    self.rng             = numpy.random.default_rng(seed)
+    self.levels          = self.rng.uniform(-60, -20, meter_sizes["/meters/2"])
+    self.rta_floor       = numpy.linspace(-50, -80, meter_sizes["/meters/4"])
+    self.feedback_frames = max(1, round(feedback_every_s / meter_period_s))
+    self.frame           = 0
+
+  def next_frame(self):
+    self.frame += 1
+    self.levels = numpy.clip(self.levels + self.rng.normal(0, 1.5, len(self.levels)), -90, -3)
+    inputs = numpy.where(self.rng.random(len(self.levels)) < 0.02, -128, self.levels)
+    rta    = self.rta_floor + self.rng.normal(0, 3, len(self.rta_floor))
+    if self.frame % self.feedback_frames < 20: # 1 s of feedback at a fixed bin
+      rta[60] = -5
+    dyn = numpy.concatenate([self.rng.uniform(-9, 0, 32), numpy.zeros(meter_sizes["/meters/6"] - 32)])
+    return tuple((numpy.asarray(x) * 256).astype(numpy.int16) for x in (inputs, rta, dyn))
+
+
+class RecordedMeters:
+  # replay of a meter log (meterlog.py) or of a legacy raw log (18 int16 input values per frame),
+  # starts over at the end of the recording
+  def __init__(self, path, raw=False):
+    if raw:
+      inputs       = numpy.fromfile(path, dtype="<i2").reshape(-1, 18)
+      self.records = numpy.zeros(len(inputs), dtype=meterlog.record_dtype(18, 100, 39))
+      self.records["inputs"] = inputs
+      self.records["rta"]    = -128 * 256
+    else:
+      self.records = meterlog.MeterLog(path).records
+    if len(self.records) == 0:
+      raise ValueError(f"no meter frames in {path}")
+    self.frame = 0
+
+  def next_frame(self):
+    record     = self.records[self.frame]
+    self.frame = (self.frame + 1) % len(self.records)
+    return (record["inputs"], record["rta"], record["dyn"])
+
+
+class MockMixer:
+  def __init__(self, meters, host="127.0.0.1", port=10024, model="XR18", speed=1.0):
+    self.meters         = meters
+    self.model          = model
+    self.speed          = speed
+    self.parameters     = {}
+    self.meter_clients  = {address: {} for address in meter_sizes} # meter address -> {client: expiry time}
+    self.remote_clients = {}                                       # /xremote client -> expiry time
+    self.mutex          = threading.Lock()
+    self.exit           = False
+    self.frames_sent    = 0
+    self.messages_in    = 0
+    self.socket         = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    self.socket.bind((host, port))
+    self.socket.settimeout(0.5)
+
+  def start(self):
+    self.threads = [threading.Thread(target=self.receive_loop), threading.Thread(target=self.meters_loop)]
+    for thread in self.threads:
+      thread.start()
+
+  def stop(self):
+    self.exit = True
+    for thread in self.threads:
+      thread.join()
+    self.socket.close()
+
+  def send(self, client, address, args=[]):
+    self.socket.sendto(encode_message(address, args), client)
+
+  def receive_loop(self):
+    while not self.exit:
+      try:
+        (data, client) = self.socket.recvfrom(65536)
+      except socket.timeout:
+        continue
+      self.messages_in += 1
+      try:
+        self.handle(decode_message(data), client)
+      except ValueError as e:
+        print(f"invalid message from {client}: {e}")
+
+  def handle(self, message, client):
+    (address, args) = message
+    if address == "/info":
+      self.send(client, "/info", ["V0.04", f"{self.model}-mock", self.model, firmware_version])
+    elif address == "/xinfo":
+      self.send(client, "/xinfo", [self.socket.getsockname()[0], f"{self.model}-mock", self.model, firmware_version])
+    elif address == "/xremote":
+      with self.mutex:
+        self.remote_clients[client] = time.monotonic() + subscription_s
+    elif address == "/meters":
+      with self.mutex:
+        if args and args[0] in self.meter_clients:
+          self.meter_clients[args[0]][client] = time.monotonic() + subscription_s
+    elif args: # set parameter, inform all other /xremote clients
+      with self.mutex:
+        self.parameters[address] = list(args)
+        others = [c for (c, expiry) in self.remote_clients.items() if c != client and expiry > time.monotonic()]
+      for other in others:
+        self.send(other, address, args)
+    else: # query parameter
+      with self.mutex:
+        values = self.parameters.get(address, default_value(address))
+      self.send(client, address, values)
+
+  def meters_loop(self):
+    # frames are sent according to a deadline so that the rate is kept also at high speed factors
+    (start_time, frame) = (time.monotonic(), 0)
+    while not self.exit:
+      delay = start_time + frame * meter_period_s / self.speed - time.monotonic()
+      if delay > 0:
+        time.sleep(min(delay, 0.5))
+        continue
+      frame += 1
+      with self.mutex:
+        now     = time.monotonic()
+        clients = {address: [c for (c, expiry) in clients.items() if expiry > now]
+                   for (address, clients) in self.meter_clients.items()}
+      if not any(clients.values()):
+        continue
+      for (address, values) in zip(meter_sizes, self.meters.next_frame()):
+        padded = numpy.zeros(meter_sizes[address], dtype=numpy.int16)
+        padded[:min(len(values), len(padded))] = values[:len(padded)]
+        for client in clients[address]:
+          self.send(client, address, [meter_blob(padded)])
+      self.frames_sent += 1
+
+
+def main():
+  parser = argparse.ArgumentParser(description="Mock X-AIR mixer on the local machine")
+  parser.add_argument("--log", help="replay this meter log (meterlog.py format)")
+  parser.add_argument("--raw", help="replay this legacy raw log (18 int16 values per frame)")
+  parser.add_argument("--speed", type=float, default=1.0, help="meter rate factor, 1: real-time (20 Hz)")
+  parser.add_argument("--host", default="127.0.0.1")
+  parser.add_argument("--port", type=int, default=10024)
+  parser.add_argument("--model", default="XR18")
+  args = parser.parse_args()
+  if args.log:
+    meters = RecordedMeters(args.log)
+  elif args.raw:
+    meters = RecordedMeters(args.raw, raw=True)
+  else:
+    meters = SyntheticMeters()
+  mixer = MockMixer(meters, args.host, args.port, args.model, args.speed)
+  mixer.start()
+  print(f"mock {args.model} listening on {args.host}:{args.port}, meter rate {20 * args.speed:g} Hz")
+  try:
+    while True:
+      (frames, messages) = (mixer.frames_sent, mixer.messages_in)
+      time.sleep(5)
+      print(f"meter frames/s: {(mixer.frames_sent - frames) / 5:.1f}, received messages/s: " \
+            f"{(mixer.messages_in - messages) / 5:.1f}")
+  except KeyboardInterrupt:
+    mixer.stop()
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,76 @@
+#*******************************************************************************
+# Copyright (c) 2024-2024
+# Author(s): Volker Fischer
+#*******************************************************************************
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA
+#*******************************************************************************
+
+# Minimal OSC 1.0 message codec with the argument types used by the X-AIR mixers:
+# int32 (i), float32 (f), string (s) and blob (b).
+
+import struct
+from collections import namedtuple
+
+OscMessage = namedtuple("OscMessage", ["address", "data"]) # same field names as the x32 messages
+
+
+def pad4(data):
+  return data + b"\0" * (-len(data) % 4)
+
+
+def encode_string(text):
+  return pad4(text.encode() + b"\0")
+
+
+def encode_message(address, args=[]):
+  (tags, payload) = (",", b"")
+  for arg in args:
+    if isinstance(arg, (bytes, bytearray)):
+      (tags, payload) = (tags + "b", payload + struct.pack(">i", len(arg)) + pad4(bytes(arg)))
+    elif isinstance(arg, str):
+      (tags, payload) = (tags + "s", payload + encode_string(arg))
+    elif isinstance(arg, float):
+      (tags, payload) = (tags + "f", payload + struct.pack(">f", arg))
+    else:
+      (tags, payload) = (tags + "i", payload + struct.pack(">i", int(arg)))
+  return encode_string(address) + encode_string(tags) + payload
+
+
+def decode_string(data, pos):
+  end = data.index(b"\0", pos)
+  return (data[pos:end].decode(errors="replace"), end + 1 + (-(end + 1) % 4))
+
+
+def decode_message(data):
+  (address, pos) = decode_string(data, 0)
+  if pos >= len(data): # no type tag string (old style message without arguments)
+    return OscMessage(address, [])
+  (tags, pos) = decode_string(data, pos)
+  args = []
+  for tag in tags[1:]:
+    if tag == "i":
+      args.append(struct.unpack_from(">i", data, pos)[0])
+      pos += 4
+    elif tag == "f":
+      args.append(struct.unpack_from(">f", data, pos)[0])
+      pos += 4
+    elif tag == "s":
+      (text, pos) = decode_string(data, pos)
+      args.append(text)
+    elif tag == "b":
+      size = struct.unpack_from(">i", data, pos)[0]
+      args.append(bytes(data[pos + 4:pos + 4 + size]))
+      pos += 4 + size + (-size % 4)
+    else:
+      raise ValueError(f"unsupported OSC type tag {tag} in {address}")
+  return OscMessage(address, args)
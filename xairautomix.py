@@ -28,14 +28,17 @@
 # Behringer: vocal compression: ratio:3, attach: 10 ms, hold: 10 ms, release: 151 ms, gain: +6 dB, self filter: type: 3,
 #                               frequency 611 Hz
 
-import sys, threading, time, struct, numpy, easygui
+# usage: python3 xairautomix.py [mixer IP address] [--headless] [--feedback] [--auto-gain-s 60]
+
+import sys, argparse, threading, queue, time, numpy
 sys.path.append('python-x32/src')
 sys.path.append('python-x32/src/pythonx32')
 from pythonx32 import x32
-from collections import deque
-import matplotlib.pyplot as plt # TODO somehow needed for "messagebox.askyesno"?
-import tkinter as tk
-from tkinter import ttk
+from collections import deque, namedtuple
+from meters import decode_meter_blob, rta_frequency, LevelHistograms, FeedbackDetector, RtaHistory
+import meterlog
+from metrics import Metrics
+from bandconfig import BandConfig, headamp_to_float
 
 # mixer channel setup, channel_dict: [name, fader, gain, HP, group, special]
 special = [0]
@@ -74,292 +77,725 @@ busses_dict = { \
 busses_pan_dict = { \
   2:[0, 0, -30, 60, -94, 44, -100,  32, -40, 0, 0,   0,  0, -46, -100, 100], \
   4:[0, 0,  20, 42, -50,  0, -100, 100,  40, 0, 0, -18, 18,   0, -100, 100]}
+default_band = BandConfig.from_dicts(channel_dict, busses_dict, busses_pan_dict, # used if no band file is given
+  {"special": special, "vocal": vocal, "bass": bass, "guitar": guitar, "drums": drums, "edrums": edrums})
+
 
-use_recorded_data     = False # TEST
+mixer_address         = []    # []: search for a mixer, e.g. "127.0.0.1" for mockmixer.py (first command line argument)
 target_max_gain       = -15 # dB
 set_gain_input_thresh = -50 # dB
 no_input_threshold    = -80 # dB
 dyn_thresh            = target_max_gain - 6 - 10 # target -6 dB reduction minus additional "magic number"
 feedback_threshold_dB = 30
+reset_tolerance       = 0.0005 # half a fader step (1024 steps), parameters not in parameter_steps
+parameter_steps       = [("/f", 201), ("/q", 72), ("/g", 121), ("/preamp/hpf", 101), ("/pan", 101), # steps of the
+                         ("/dyn/thr", 121), ("/dyn/mgain", 49), ("/dyn/attack", 121),  # parameters which are stored
+                         ("/dyn/hold", 101), ("/dyn/release", 101), ("/dyn/knee", 11), # coarser than a fader, by OSC
+                         ("/dyn/mix", 21), ("/headamp/gain", 145)]                     # address suffix
+osc_batch_len         = 64     # max number of outstanding pipelined OSC messages
+write_rate_per_s      = 500    # max rate of the scheduled (coalesced) OSC writes to the mixer
+write_period_s        = 0.01   # scheduled writes are sent in bursts every 10 ms
+priority_feedback     = 0      # priorities of the scheduled writes, lower values are sent first
+priority_gain         = 1
+priority_normal       = 2
 
 channel              = 0    # initialization value for channel selection
 len_meter2           = 18   # ALL INPUTS (16 mic, 2 aux, 18 usb = 36 values total but we only need the mic inputs)
 len_meter4           = 100  # RTA100 (100 bins RTA = 100 values)
 len_meter6           = 16   # ALL DYN (16 gate, 16 dyn(ch), 6 dyn(bus), dyn(lr) = 39 values total but we want 16 dyn only)
+len_meter6_all       = 39   # ALL DYN values which are stored in the meter log
 hist_len             = 128  # histogram bins
+hist_window_s        = 10   # histogram time resolution
+hist_history_s       = 1800 # histograms can look back 30 minutes
+hist_gui_window_s    = None # time span of the shown histogram, None: since last reset
+max_level_window_s   = None # time span for the max level used for the gain, None: since last reset
+hist_decay_s         = None # e.g. 60: exponentially decaying histograms and max levels instead of the time spans above
 rta_hist_height      = 120
+rta_history_s        = 60   # RTA spectrogram at full rate
+rta_history_tiers    = [(1, 3600), (10, 6 * 3600)] # decimated RTA spectrogram: (row period, history) in s
+rta_persistence_s    = 300  # time span for finding ringing frequencies (persistent RTA peaks)
 meter_update_s       = 0.05 # update cycle frequency for meter data is 50 ms
 min_feedback_count   = 0.4 / meter_update_s # minimum 0.4 s feedback duration
 rta_line_width       = 3
 hist_line_width      = 3
-is_XR16              = False
-exit_threads         = False
-do_feedback_cancel   = False
-file_path            = "test.dat"
-input_values         = [0] * len_meter2
-input_rta            = [0] * len_meter4
-feedback_count       = [0] * len_meter4
-all_raw_inputs_queue = deque()
-data_mutex           = threading.Lock()
+gui_frame_rate       = 20   # GUI redraws per second
+file_path            = "meters_%Y%m%d_%H%M%S.xrl" # time.strftime pattern, one meter log file per run
+metrics_enabled      = False # per stage latency measurement (small overhead)
+metrics_file         = "metrics.json" # written every 5 s if metrics are enabled, None: no file
+metrics_port         = None  # e.g. 9100: http://127.0.0.1:9100/metrics (Prometheus) if metrics are enabled
+metrics              = Metrics(metrics_enabled)
+
+lr_eq_bands          = [{p: f"/lr/eq/{i + 1}/{p}" for p in ["type", "f", "g", "q"]} for i in range(6)]
+meters_requests      = [('/xremote', []),            # push all parameter changes to us (valid for 10 s)
+                        ('/meters', ['/meters/2']), # ALL INPUTS
+                        ('/meters', ['/meters/4']), # RTA100
+                        ('/meters', ['/meters/6'])] # ALL DYN
+
+MeterFrame    = namedtuple("MeterFrame", ["seq", "time", "input_values", "input_rta", "dyn_values"])
+MeterSnapshot = namedtuple("MeterSnapshot", ["seq", "input_values", "input_rta", "max_levels", "gatedyn_min_values",
+                                             "histograms"])
+GuiView       = namedtuple("GuiView", ["bars", "level_labels", "dyn_labels", "rta_heights", "hist_heights",
+                                       "hist_max_index"])
 
 
 def main():
-  global mixer, is_XR16
-  reset_histograms()
-  mixer   = x32.BehringerX32([], 10300, False, 4) # initialized and search for a mixer
-  is_XR16 = "XR16" in mixer.get_value("/info")[2]
-  configure_rta(31) # 31: MainLR on XAIR16
-  # start separate threads
-  threading.Timer(0.0, send_meters_request_message).start()
-  threading.Timer(0.0, receive_meter_messages).start()
-  threading.Timer(0.0, store_input_levels_in_file).start()
-  threading.Timer(0.0, gui_thread).start()
-
-
-def apply_optimal_gain(ch, reset=True):
-  with data_mutex:
-    max_value = input_max_values[ch]
-    if max_value > no_input_threshold:
-      mixer.set_value(f"/ch/{ch + 1:#02}/mix/on", [1]) # unmute channel
-      if max_value > set_gain_input_thresh:
-        set_gain(ch, float(get_gain(ch) - (max_value - target_max_gain)))
+  parser = argparse.ArgumentParser(description="Auto mixing for the Behringer X-AIR mixers")
+  parser.add_argument("address", nargs="?", default=mixer_address, help="mixer IP address, default: search for a mixer")
+  parser.add_argument("--headless", action="store_true", help="run without GUI (e.g. on a small computer at the rack)")
+  parser.add_argument("--feedback", action="store_true", help="start with feedback cancellation enabled")
+  parser.add_argument("--auto-gain-s", type=float, help="headless: apply the optimal gains every given seconds")
+  parser.add_argument("--no-log", action="store_true", help="do not write a meter log file")
+  parser.add_argument("--metrics-port", type=int, default=metrics_port, help="enables the metrics HTTP endpoint")
+  parser.add_argument("--band", help="band setup file (JSON or YAML), default: channel_dict/busses_dict")
+  parser.add_argument("--save-band", help="write the band setup as JSON file (e.g. as template) and exit")
+  args = parser.parse_args()
+  band = BandConfig.load(args.band) if args.band else default_band
+  if args.save_band:
+    band.save(args.save_band)
+    return
+  metrics.enabled = metrics.enabled or args.metrics_port is not None
+  mixer  = x32.BehringerX32(args.address, 10300, False, 4) # initialized and search for a mixer
+  engine = AutoMixEngine(mixer, log_meters=not args.no_log, band=band)
+  engine.set_feedback_cancellation(args.feedback)
+  engine.start()
+  if metrics.enabled:
+    metrics.add_source("routes", engine.dispatcher.stats)
+    metrics.add_source("parameter_cache", engine.parameter_cache.stats)
+    metrics.add_source("queues", engine.queue_stats)
+    metrics.add_source("writes", engine.writes.stats)
+    metrics.start_export(metrics_file, args.metrics_port)
+  try:
+    if args.headless:
+      run_headless(engine, args.auto_gain_s)
     else:
-      pass # disabled mute for now
-      #mixer.set_value(f"/ch/{ch + 1:#02}/mix/on", [0]) # mute channel with no input level
-  if reset:
-    reset_histograms(ch) # history needs to be reset on updated gain settings
-
-
-def get_gain(ch):
-  if ch >= 8 and is_XR16:
-    return mixer.get_value(f"/headamp/{ch + 9:#02}/gain")[0] * (20 - (-12)) - 12
-  else:
-    return mixer.get_value(f"/headamp/{ch + 1:#02}/gain")[0] * (60 - (-12)) - 12
-
-
-def set_gain(ch, x):
-  x = round(x * 2) / 2 # round to 0.5
-  if ch >= 8 and is_XR16:
-    value = max(0, min(0.984375, (x + 12) / (20 - (-12))))
-    mixer.set_value(f"/headamp/{ch + 9:#02}/gain", [value])
-    return value * (20 - (-12)) - 12
-  else:
-    value = max(0, min(0.9861111, (x + 12) / (60 - (-12))))
-    mixer.set_value(f"/headamp/{ch + 1:#02}/gain", [value])
-    return value * (60 - (-12)) - 12
-
-
-def basic_setup_mixer(mixer):
-  if easygui.ynbox('Are you sure to reset all mixer settings?', 'Reset All Check', ['Yes', 'No']):
+      run_gui(engine)
+  finally:
+    engine.stop()
+
+
+def run_headless(engine, auto_gain_s):
+  try:
+    while not engine.exit:
+      time.sleep(auto_gain_s or 1)
+      if auto_gain_s:
+        engine.apply_optimal_gains()
+  except KeyboardInterrupt:
+    pass
+
+
+def parameter_tolerance(address):
+  # the mixer quantizes the parameters, allow half a step of deviation
+  if address.startswith("/headamp/") and address.endswith("/gain"):
+    address = "/headamp/gain"
+  for (suffix, steps) in parameter_steps:
+    if address.endswith(suffix):
+      return max(reset_tolerance, 0.5 / (steps - 1) + 1e-6) # float32 readback
+  return reset_tolerance
+
+
+def values_equal(current, desired, tolerance=reset_tolerance):
+  if current is None or len(current) != len(desired):
+    return False
+  for (c, d) in zip(current, desired):
+    if isinstance(d, str) or isinstance(c, str):
+      if c != d:
+        return False
+    elif abs(c - d) > tolerance:
+      return False
+  return True
+
+
+class MessageRoute:
+  # consumer of all messages with a given address prefix, either a callback or a queue
+  def __init__(self, prefix, target, max_queue_len):
+    self.prefix    = prefix
+    self.target    = target if target is not None else queue.Queue(max_queue_len)
+    self.delivered = 0
+    self.dropped   = 0
+
+  def deliver(self, message):
+    if callable(self.target):
+      self.target(message)
+    else:
+      try:
+        self.target.put_nowait(message)
+      except queue.Full: # consumer too slow: drop the oldest message, the newest is more relevant
+        self.dropped += 1
+        try:
+          self.target.get_nowait()
+        except queue.Empty:
+          pass
+        self.target.put_nowait(message)
+    self.delivered += 1
+
+  def depth(self):
+    return 0 if callable(self.target) else self.target.qsize()
+
+
+class MessageDispatcher:
+  # routes each received OSC message to exactly one consumer, longest address prefix wins
+  def __init__(self):
+    self.routes   = []
+    self.unrouted = 0
+
+  def add_route(self, prefix, target=None, max_queue_len=100):
+    route = MessageRoute(prefix, target, max_queue_len)
+    self.routes.append(route)
+    self.routes.sort(key=lambda r: len(r.prefix), reverse=True)
+    return route
+
+  def dispatch(self, message):
+    for route in self.routes:
+      if message.address.startswith(route.prefix):
+        route.deliver(message)
+        return
+    self.unrouted += 1
+
+  def stats(self):
+    return {route.prefix: {"delivered": route.delivered, "dropped": route.dropped, "depth": route.depth()}
+            for route in self.routes}
+
+
+class ParameterCache:
+  # local shadow of the mixer parameters, filled once and then kept up to date by the
+  # /xremote pushes of the mixer, the query replies and our own writes
+  def __init__(self):
+    self.values        = {} # OSC address -> [values, time of last update]
+    self.mutex         = threading.Lock()
+    self.hits          = 0
+    self.misses        = 0
+    self.updates       = 0
+    self.invalidations = 0
+
+  def update(self, address, values):
+    with metrics.lock(self.mutex, "parameter_cache"):
+      self.values[address] = [list(values), time.monotonic()]
+      self.updates += 1
+
+  def get(self, address, max_age_s=None):
+    with metrics.lock(self.mutex, "parameter_cache"):
+      entry = self.values.get(address)
+      if entry is None or (max_age_s is not None and time.monotonic() - entry[1] > max_age_s):
+        self.misses += 1
+        return None
+      self.hits += 1
+      return entry[0]
+
+  def invalidate(self, address=None):
+    with metrics.lock(self.mutex, "parameter_cache"):
+      if address is None:
+        self.invalidations += len(self.values)
+        self.values.clear()
+      elif self.values.pop(address, None) is not None:
+        self.invalidations += 1
+
+  def stats(self):
+    with metrics.lock(self.mutex, "parameter_cache"):
+      ages = [time.monotonic() - entry[1] for entry in self.values.values()]
+      return {"entries": len(self.values), "hits": self.hits, "misses": self.misses, "updates": self.updates,
+              "invalidations": self.invalidations, "max_age_s": max(ages, default=0),
+              "mean_age_s": sum(ages) / len(ages) if ages else 0}
+
+
+class WriteScheduler:
+  # outgoing parameter writes: only the latest value per OSC address is kept, the pending writes
+  # are sent in priority order (then in order of their first write) with at most write_rate_per_s
+  def __init__(self, send, rate_per_s=write_rate_per_s, period_s=write_period_s):
+    self.send       = send
+    self.period_s   = period_s
+    self.per_period = max(1, round(rate_per_s * period_s))
+    self.pending    = {} # OSC address -> [priority, order, values]
+    self.order      = 0
+    self.wakeup     = threading.Condition()
+    self.queued     = 0
+    self.coalesced  = 0
+    self.sent       = 0
+    self.actions    = [] # (OSC addresses, function): called after these writes were sent
+
+  def put(self, address, values, priority=priority_normal):
+    with metrics.lock(self.wakeup, "write_scheduler"):
+      entry = self.pending.get(address)
+      if entry is None:
+        self.pending[address] = [priority, self.order, values]
+        self.order += 1
+      else: # replaces the pending value, keeps the position and the highest priority
+        (entry[0], entry[2]) = (min(entry[0], priority), values)
+        self.coalesced += 1
+      self.queued += 1
+      self.wakeup.notify()
+
+  def take(self, n):
+    # the n most urgent pending writes, None: all
+    with metrics.lock(self.wakeup, "write_scheduler"):
+      due = sorted(self.pending.items(), key=lambda item: item[1][:2])[:n]
+      for (address, _) in due:
+        del self.pending[address]
+    return [(address, entry[2]) for (address, entry) in due]
+
+  def send_due(self, n):
+    writes = self.take(n)
+    for (address, values) in writes:
+      self.send(address, values)
+    self.sent += len(writes) # only one thread sends
+    if self.actions:
+      self.run_actions()
+    return len(writes)
+
+  def when_sent(self, addresses, function):
+    # calls function (in the sending thread) once none of the addresses has a pending write
+    with metrics.lock(self.wakeup, "write_scheduler"):
+      if any(address in self.pending for address in addresses):
+        self.actions.append((addresses, function))
+        return
+    function()
+
+  def run_actions(self):
+    with metrics.lock(self.wakeup, "write_scheduler"):
+      done = [a for a in self.actions if not any(address in self.pending for address in a[0])]
+      self.actions = [a for a in self.actions if a not in done]
+    for (_, function) in done:
+      function()
+
+  def run(self, is_exit):
+    while not is_exit():
+      with self.wakeup:
+        if not self.pending:
+          self.wakeup.wait(0.5)
+      if self.send_due(self.per_period):
+        time.sleep(self.period_s)
+    self.send_due(None) # nothing queued gets lost on exit
+
+  def discard(self):
+    with metrics.lock(self.wakeup, "write_scheduler"):
+      self.pending.clear()
+
+  def stats(self):
+    with metrics.lock(self.wakeup, "write_scheduler"):
+      return {"pending": len(self.pending), "queued": self.queued, "coalesced": self.coalesced, "sent": self.sent}
+
+
+class AutoMixEngine:
+  # owns the mixer connection and all processing (meter reception, histograms, max/min tracking,
+  # feedback detection, gain application), runs without GUI, a GUI only reads snapshot()
+  def __init__(self, mixer, log_meters=True, log_path=file_path, band=default_band):
+    self.mixer               = mixer
+    self.band                = band
+    self.log_meters          = log_meters
+    self.log_path            = log_path # time.strftime pattern
+    self.is_XR16             = False
+    self.exit                = False
+    self.threads             = []
+    self.do_feedback_cancel  = False
+    self.frame               = MeterFrame(0, 0.0, read_only(numpy.full(len_meter2, -128, dtype=numpy.float32)),
+                                          read_only(numpy.full(len_meter4, -128, dtype=numpy.float32)),
+                                          read_only(numpy.zeros(len_meter6_all, dtype=numpy.float32)))
+    self.state_seq           = 0       # odd while the receiver updates histograms/max/min (sequence lock)
+    self.commands            = deque() # (function, args) executed by the receive thread, e.g. resets
+    self.input_rta_raw       = numpy.zeros(len_meter4, dtype=numpy.int16)
+    self.dyn_raw             = numpy.zeros(len_meter6_all, dtype=numpy.int16)
+    self.meter_log_fresh     = 0 # meter streams updated since the last meter log record
+    self.meter_log_queue     = deque()
+    self.meter_arrival       = {} # meter address -> last arrival time, for the late/lost frame metrics
+    self.feedback_detector   = FeedbackDetector(len_meter4, feedback_threshold_dB, min_feedback_count)
+    self.rta_history         = RtaHistory(len_meter4, meter_update_s, rta_history_s, rta_history_tiers)
+    self.rta_queue           = queue.Queue(100) # every RTA frame for the feedback detection
+    self.rta_queue_drops     = 0
+    self.feedback_timeouts   = 0 # feedback not cancelled because the mixer did not answer
+    self.receive_errors      = 0 # received messages whose processing failed
+    self.short_meter_blobs   = 0 # meter blobs with less values than used, ignored
+    self.reply_waiters       = {} # OSC address -> list of queues waiting for the parameter reply
+    self.reply_waiters_mutex = threading.Lock()
+    self.parameter_cache     = ParameterCache()
+    self.writes              = WriteScheduler(self.send_value)
+    self.dispatcher          = MessageDispatcher()
+    self.dispatcher.add_route("/meters/2", self.receive_inputs_meter) # ALL INPUTS
+    self.dispatcher.add_route("/meters/4", self.receive_rta_meter)    # RTA100
+    self.dispatcher.add_route("/meters/6", self.receive_dyn_meter)    # ALL DYN
+    self.dispatcher.add_route("/", self.receive_parameter_reply)      # everything else are parameter replies
+    self.execute_reset() # the receive thread does not run yet
+
+  def start(self):
+    self.is_XR16 = "XR16" in self.mixer.get_value("/info")[2] # before the receive thread takes the messages
+    self.configure_rta(31) # 31: MainLR on XAIR16
+    self.start_thread(self.receive_messages)
+    self.start_thread(self.send_meters_request_message)
+    self.fill_parameter_cache()
+    self.start_thread(lambda: self.writes.run(lambda: self.exit))
+    self.start_thread(self.feedback_thread)
+    if self.log_meters:
+      self.start_thread(self.store_input_levels_in_file)
+
+  def start_thread(self, function):
+    thread = threading.Thread(target=function, daemon=True) # the receive thread may block in the mixer queue
+    thread.start()
+    self.threads.append(thread)
+
+  def stop(self):
+    self.exit = True
+    for thread in self.threads:
+      thread.join(timeout=2)
+
+  def snapshot(self, hist_window_s=None):
+    # latest meter frame and copies of the histogram state for observers like the GUI, never blocks the receiver
+    frame = self.frame # published frames are immutable, taking the reference is enough
+    (max_levels, gatedyn_min_values, histograms) = self.read_state(
+      lambda: (self.get_max_levels().copy(), self.gatedyn_min_values.copy(),
+               self.input_histograms.decaying_histogram() if hist_decay_s else
+               self.input_histograms.histogram(hist_window_s).copy()))
+    return MeterSnapshot(frame.seq, frame.input_values, frame.input_rta, max_levels, gatedyn_min_values, histograms)
+
+  def read_state(self, function):
+    # sequence lock reader: retry if the receive thread updated the state in the meantime
+    while True:
+      seq = self.state_seq
+      if seq % 2 == 0:
+        result = function()
+        if self.state_seq == seq:
+          return result
+      metrics.count("snapshot_retries")
+      time.sleep(0) # give the receive thread the chance to finish its update
+
+  def begin_update(self):
+    # only called from the receive thread, which is the only writer of the meter state
+    self.state_seq += 1
     try:
-      mixer.set_value("/lr/mix/fader", [0]) # default: main LR fader to minimum
-      for bus in range(6):
-        mixer.set_value(f"/bus/{bus + 1}/config/name", [busses_dict[bus][0]])
-        mixer.set_value(f"/bus/{bus + 1}/mix/fader", [mixer.db_to_float(busses_dict[bus][2])])
-        mixer.set_value(f"/bus/{bus + 1}/config/color", [3]) # default: monitor busses are in yellow
-        mixer.set_value(f"/bus/{bus + 1}/eq/on", [0])        # default: bus EQ off
-        if len(busses_dict[bus]) > 3: # special bus settings
-          if "LINK" in busses_dict[bus][3] and bus % 2 == 1:
-            mixer.set_value(f"/config/buslink/{bus}-{bus + 1}", [1])
-        for rtn in range(4):
-          mixer.set_value(f"/rtn/{rtn + 1}/mix/{bus + 1:#02}/level", [0]) # default: FX level to lowest value
-      for ch in channel_dict:
-        inst_group = channel_dict[ch][5]
-        set_gain(ch, channel_dict[ch][2])
-        mixer.set_value(f"/ch/{ch + 1:#02}/config/color", [inst_group[0]])
-        mixer.set_value(f"/ch/{ch + 1:#02}/config/name", [channel_dict[ch][0]])
-        mixer.set_value(f"/ch/{ch + 1:#02}/mix/on", [1])        # default: unmute channel
-        mixer.set_value(f"/ch/{ch + 1:#02}/mix/fader", [mixer.db_to_float(channel_dict[ch][1])]) # note: unmute necessary
-        mixer.set_value(f"/ch/{ch + 1:#02}/config/insrc", [ch]) # default: linear in/out mapping
-        mixer.set_value(f"/ch/{ch + 1:#02}/mix/lr", [1])        # default: send to LR master
-        mixer.set_value(f"/ch/{ch + 1:#02}/grp/mute", [0])      # default: no mute group
-        mixer.set_value(f"/-stat/solosw/{ch + 1:#02}", [0])     # default: no Solo
-        mixer.set_value(f"/ch/{ch + 1:#02}/grp/dca", [0])       # default: no DCA group
-        mixer.set_value(f"/headamp/{ch + 1:#02}/phantom", [0])  # default: no phantom power
-        mixer.set_value(f"/ch/{ch + 1:#02}/mix/pan", [0.5])     # default: middle position
-        mixer.set_value(f"/ch/{ch + 1:#02}/gate/on", [0])       # default: gate off
-        mixer.set_value(f"/ch/{ch + 1:#02}/dyn/on", [0])        # default: compressor off
-        mixer.set_value(f"/ch/{ch + 1:#02}/eq/on", [1])         # default: EQ on
-        mixer.set_value(f"/ch/{ch + 1:#02}/preamp/hpon", [1])   # default: high-pass on
-        mixer.set_value(f"/ch/{ch + 1:#02}/preamp/hpf", [mixer.freq_to_float(channel_dict[ch][3], 400)], False)
-        for i in range(4):
-          mixer.set_value(f"/ch/{ch + 1:#02}/eq/{i + 1}/type", [2]) # default: EQ, PEQ
-          mixer.set_value(f"/ch/{ch + 1:#02}/eq/{i + 1}/g", [0.5])  # default: EQ, 0 dB gain
-        for i in range(len(channel_dict[ch][4])): # individual channel EQ settings
-          if len(channel_dict[ch][4][i]) > 2:
-            mixer.set_value(f"/ch/{ch + 1:#02}/eq/{i + 1}/g", [(channel_dict[ch][4][i][0] + 15) / 30])
-            mixer.set_value(f"/ch/{ch + 1:#02}/eq/{i + 1}/f", [mixer.freq_to_float(channel_dict[ch][4][i][1])])
-            mixer.set_value(f"/ch/{ch + 1:#02}/eq/{i + 1}/q", [mixer.q_to_float(channel_dict[ch][4][i][2])])
-          else: # special case: type and frequency
-            mixer.set_value(f"/ch/{ch + 1:#02}/eq/{i + 1}/type", [channel_dict[ch][4][i][0]])
-            mixer.set_value(f"/ch/{ch + 1:#02}/eq/{i + 1}/f", [mixer.freq_to_float(channel_dict[ch][4][i][1])])
-        mixer.set_value(f"/ch/{ch + 1:#02}/dyn/keysrc", [0])            # default comp: key source SELF
-        mixer.set_value(f"/ch/{ch + 1:#02}/dyn/mode", [0])              # default comp: compresser mode
-        mixer.set_value(f"/ch/{ch + 1:#02}/dyn/auto", [0])              # default comp: auto compresser off
-        mixer.set_value(f"/ch/{ch + 1:#02}/dyn/knee", [0.4])            # default comp: knee 2
-        mixer.set_value(f"/ch/{ch + 1:#02}/dyn/det", [0])               # default comp: det PEAK
-        mixer.set_value(f"/ch/{ch + 1:#02}/dyn/env", [1])               # default comp: env LOG
-        mixer.set_value(f"/ch/{ch + 1:#02}/dyn/mix", [1.0])             # default comp: mix 100 %
-        mixer.set_value(f"/ch/{ch + 1:#02}/dyn/thr", [(dyn_thresh + 60) / 60]) # default comp: pre-defined threshold
-        if len(inst_group) > 1 and "VOCALDYN" in inst_group[1]:         # vocal dynamic presets:
-          mixer.set_value(f"/ch/{ch + 1:#02}/dyn/on", [1])              # vocal default: compresser on
-          mixer.set_value(f"/ch/{ch + 1:#02}/dyn/ratio", [5])           # vocal default: ratio 3
-          mixer.set_value(f"/ch/{ch + 1:#02}/dyn/mgain", [0.25])        # vocal default: gain 6 dB
-          mixer.set_value(f"/ch/{ch + 1:#02}/dyn/attack", [0.08333333]) # vocal default: attack 10 ms
-          mixer.set_value(f"/ch/{ch + 1:#02}/dyn/hold", [0.54])         # vocal default: hold 10 ms
-          mixer.set_value(f"/ch/{ch + 1:#02}/dyn/release", [0.45])      # vocal default: release 101 ms
-          mixer.set_value(f"/ch/{ch + 1:#02}/dyn/filter/on", [1])       # vocal default: filter on
-          mixer.set_value(f"/ch/{ch + 1:#02}/dyn/filter/type", [6])     # vocal default: filter type 3
-          mixer.set_value(f"/ch/{ch + 1:#02}/dyn/filter/f", [0.495])    # vocal default: filter 611 Hz
-        for bus in range(10):
-          mixer.set_value(f"/ch/{ch + 1:#02}/mix/{bus + 1:#02}/tap", [3]) # default: bus Pre Fader
-          mixer.set_value(f"/ch/{ch + 1:#02}/mix/{bus + 1:#02}/level", [0])
-          if bus in busses_dict:
-            mixer.set_value(f"/ch/{ch + 1:#02}/mix/{bus + 1:#02}/level", [mixer.db_to_float(busses_dict[bus][1][ch], True)])
-        for bus in range(0, 6, 2): # adjust pan in send busses per channel (every second bus)
-          if bus in busses_pan_dict:
-            mixer.set_value(f"/ch/{ch + 1:#02}/mix/{bus + 1:#02}/pan", [(int(busses_pan_dict[bus][ch] / 2) + 50) / 100])
-          else:
-            mixer.set_value(f"/ch/{ch + 1:#02}/mix/{bus + 1:#02}/pan", [0.5]) # default: middle position
-        if ch % 2 == 1:
-          mixer.set_value(f"/config/chlink/{ch}-{ch + 1}", [0]) # default: no stereo link
-        mixer.set_value("/fx/1/type", [0])                # default: FX1 Hall Reverb (for vocals)
-        mixer.set_value("/fx/1/par/01", [0.1])            # default: FX1 PRE DEL 20 ms
-        mixer.set_value("/fx/1/par/02", [0.64])           # default: FX1 DECAY 1.57 s
-        mixer.set_value("/fx/1/par/03", [0.59183675])     # default: FX1 SIZE 60
-        mixer.set_value("/fx/1/par/04", [0.58333333])     # default: FX1 DAMP 5k74 Hz
-        mixer.set_value("/fx/1/par/05", [0.82758623])     # default: FX1 DIFF 25
-        mixer.set_value("/fx/1/par/06", [0.5])            # default: FX1 LEVEL 0 dB
-        mixer.set_value("/fx/2/type", [3])                # default: FX2 Room Reverb (for drums)
-        mixer.set_value("/fx/2/par/01", [0.03])           # default: FX2 PRE DEL 6 ms
-        mixer.set_value("/fx/2/par/02", [0.08])           # default: FX2 DECAY 0.43 s
-        mixer.set_value("/fx/2/par/03", [0.19444444])     # default: FX2 SIZE 18 m
-        mixer.set_value("/fx/2/par/04", [0.45833334])     # default: FX2 DAMP 3k94 Hz
-        mixer.set_value("/fx/2/par/05", [0.68])           # default: FX2 DIFF 68 %
-        mixer.set_value("/fx/2/par/06", [0.5])            # default: FX2 LEVEL 0 dB
-        mixer.set_value("/rtn/1/mix/fader", [0.74975562]) # default:   0 dB return level for FX1 (vocal)
-        mixer.set_value("/rtn/2/mix/fader", [0.74975562]) # default:   0 dB return level for FX2 (drums)
-        mixer.set_value("/rtn/3/mix/fader", [0])          # default: -90 dB return level for FX3 (not used)
-        mixer.set_value("/rtn/4/mix/fader", [0])          # default: -90 dB return level for FX4 (not used)
-        mixer.set_value("/config/solo/source", [14])      # default: monitor source BUS 5/6 (monitor Volker)
-        mixer.set_value("/lr/eq/on", [0])                 # default: master EQ off
-        mixer.set_value("/lr/eq/mode", [0])               # default: PEQ for master EQ, needed for feedback cancellation
-        for i in range(6):
-          mixer.set_value(f"/lr/eq/{i + 1}/g", [0.5])     # default: master EQ Gain 0 dB
-        if len(channel_dict[ch]) > 6: # special channel settings
-          if "NOMIX" in channel_dict[ch][6]:
-            mixer.set_value(f"/ch/{ch + 1:#02}/mix/lr", [0])
-          if "PHANT" in channel_dict[ch][6]:
-            mixer.set_value(f"/headamp/{ch + 1:#02}/phantom", [1])
-          if "LINK" in channel_dict[ch][6] and ch % 2 == 1:
-            mixer.set_value(f"/config/chlink/{ch}-{ch + 1}", [1])
-    except:
-      easygui.msgbox('Reset failed!')
-
-
-def configure_rta(channel):
-  mixer.set_value("/-prefs/rta/decay", [0])       # fastest possible decay
-  mixer.set_value("/-prefs/rta/det", [0])         # 0: peak, 1: RMS
-  mixer.set_value("/-stat/rta/source", [channel]) # note: zero-based channel number
-
-
-def send_meters_request_message():
-  while not exit_threads:
-    mixer.set_value(f'/meters', ['/meters/2'], False) # ALL INPUTS
-    mixer.set_value(f'/meters', ['/meters/4'], False) # RTA100
-    mixer.set_value(f'/meters', ['/meters/6'], False) # ALL DYN
-    if not exit_threads: time.sleep(1) # every second update meters request
-
-
-# TEST
-if use_recorded_data:
-  f = open("_test.dat", mode="rb")
-  data1 = numpy.reshape(numpy.fromfile(f, dtype=numpy.int16), (-1, 18))
-  count = 60000
-  f.close()
-
-
-def receive_meter_messages():
-  global mixer, input_values, input_max_values, input_rta, gatedyn_min_values, count
-  while not exit_threads:
-    message = mixer.get_msg_from_queue()
-    if message.address == "/meters/2" or message.address == "/meters/4" or message.address == "/meters/6":
-      data = bytearray(message.data[0])
-      if len(data) >= 4:
-        size = struct.unpack('i', data[:4])[0]
-        (values, raw_values) = ([0] * size, [0] * size)
-        for i in range(size):
-          raw_values[i] = struct.unpack('h', data[4 + i * 2:4 + i * 2 + 2])[0] # signed integer 16 bit
-          values[i]     = raw_values[i] / 256                                  # resolution 1/256 dB
-
-        with data_mutex:
-          if message.address == "/meters/2":
-
-            # TEST NOTE: "global count" can be removed as soon as the TEST code is removed
-            if use_recorded_data:
-              values = data1[count] / 256
-              count += 1
-
-            all_raw_inputs_queue.append(raw_values[:len_meter2])
-            input_values = values[:len_meter2]
-            input_max_values = numpy.maximum(input_max_values, input_values)
-            calc_histograms(input_values, input_histograms)
-          elif message.address == "/meters/4":
-            input_rta = values
-          elif message.address == "/meters/6":
-            gatedyn_min_values = numpy.minimum(gatedyn_min_values, values[16:16 + len_meter6]) # dyn: 16..31
+      while self.commands:
+        (function, args) = self.commands.popleft()
+        function(*args)
+    except BaseException:
+      self.end_update() # readers must never see an odd sequence forever
+      raise
+
+  def end_update(self):
+    self.state_seq += 1
+
+  def publish(self, **values):
+    self.frame = self.frame._replace(seq=self.frame.seq + 1, time=time.time(), **values)
+
+  def queue_stats(self):
+    return {"rta_queue": self.rta_queue.qsize(), "meter_log_queue": len(self.meter_log_queue),
+            "rta_queue_drops": self.rta_queue_drops, "feedback_timeouts": self.feedback_timeouts,
+            "receive_errors": self.receive_errors, "short_meter_blobs": self.short_meter_blobs}
+
+  def apply_optimal_gain(self, ch):
+    self.apply_optimal_gains([ch])
+
+  def apply_optimal_gains(self, channels=None):
+    # batch: all target gains from one consistent read of the max levels, current gains from the cache
+    # (one pipelined bulk query for the missing ones), then all changed values are written pipelined
+    with metrics.stage("apply_gains"):
+      all_channels = channels is None
+      channels     = list(range(len(self.band.channels))) if all_channels else channels
+      max_levels   = self.read_state(lambda: self.get_max_levels().copy())
+      gains        = {ch: self.band.channels[ch].headamp[self.is_XR16] for ch in channels}
+      current      = {address: self.parameter_cache.get(address) for (address, _) in gains.values()}
+      current.update(self.query_values([address for address in current if current[address] is None]))
+      writes = []
+      for ch in channels:
+        if max_levels[ch] > no_input_threshold:
+          writes.append((self.band.channels[ch].mix_on, [1])) # unmute channel
+          (address, gain_range) = gains[ch]
+          if max_levels[ch] > set_gain_input_thresh and current.get(address) is not None:
+            gain = current[address][0] * gain_range - 12
+            (address, value) = headamp_to_float(gains[ch], float(gain - (max_levels[ch] - target_max_gain)))
+            writes.append((address, [value]))
+        else:
+          pass # disabled mute for now
+          #writes.append((self.band.channels[ch].mix_on, [0])) # mute channel with no input level
+      queued = []
+      for (address, values) in writes:
+        if not values_equal(self.parameter_cache.get(address), values, parameter_tolerance(address)):
+          self.queue_value(address, values, priority_gain)
+          queued.append(address)
+    def reset(): # history needs to be reset on updated gain settings, but not before they are sent
+      if all_channels:
+        self.reset_histograms()
+      else:
+        for ch in channels:
+          self.reset_histograms(ch)
+    self.writes.when_sent(queued, reset)
+
+  def basic_setup_mixer(self):
+    # returns the number of writes and of skipped (unchanged) parameters
+    start_time = time.monotonic()
+    self.writes.discard()             # pending writes would overwrite the reset values
+    self.parameter_cache.invalidate() # a reset always works on the actual mixer state
+    setup      = self.band.mixer_setup(self.mixer, self.is_XR16, dyn_thresh)
+    current    = self.query_values(list(setup))                # bulk read of the current mixer state
+    changed    = [a for a in setup if not values_equal(current.get(a), setup[a], parameter_tolerance(a))]
+    self.send_values([(a, setup[a]) for a in changed])
+    current    = self.query_values(changed)                    # verify instead of a readback per write
+    self.send_values([(a, setup[a]) for a in changed if not values_equal(current.get(a), setup[a],
+                                                                         parameter_tolerance(a))])
+    print(f"Reset: {len(changed)} writes, {len(setup) - len(changed)} skipped (unchanged), " \
+          f"{time.monotonic() - start_time:.1f} s")
+    return (len(changed), len(setup) - len(changed))
+
+  def configure_rta(self, channel):
+    self.mixer.set_value("/-prefs/rta/decay", [0])       # fastest possible decay
+    self.mixer.set_value("/-prefs/rta/det", [0])         # 0: peak, 1: RMS
+    self.mixer.set_value("/-stat/rta/source", [channel]) # note: zero-based channel number
+
+  def send_meters_request_message(self):
+    while not self.exit:
+      for (address, values) in meters_requests:
+        self.mixer.set_value(address, values, False)
+      if not self.exit: time.sleep(1) # every second update meters request
+
+  def receive_messages(self):
+    # only consumer of the mixer receive queue, nothing is put back on the queue
+    while not self.exit:
+      try:
+        message = self.mixer.get_msg_from_queue()
+      except queue.Empty:
+        continue
+      self.receive_message(message)
+
+  def receive_message(self, message):
+    # one bad datagram must not stop the meter processing
+    metrics.count("messages_received")
+    try:
+      self.dispatcher.dispatch(message)
+    except Exception as e:
+      self.receive_errors += 1
+      print(f"Error in received message {message.address}: {type(e).__name__}: {e}")
+
+  def receive_inputs_meter(self, message):
+    if metrics.enabled: self.check_meter_timing(message.address)
+    with metrics.stage("decode"):
+      (raw_values, values) = decode_meter_blob(message.data[0]) # int16 view and float32 dB values
+    if raw_values is None or len(values) < len_meter2:
+      self.short_meter_blobs += 1
     else:
-      # no meters message, put it back on queue and give other thread some time to process message
-      mixer.put_msg_on_queue(message)
-      time.sleep(0.01)
-
-
-def calc_histograms(values, histograms):
-  for i in range(len(values)):
-    histograms[i][min(127, round((values[i] + 128) / 128 * hist_len))] += 1
-
-def reset_histograms(ch = []):
-  global input_histograms, input_max_values, gatedyn_min_values
-  with data_mutex:
-    if ch:
-      input_histograms[ch]   = [0] * hist_len
-      input_max_values[ch]   = -128
-      gatedyn_min_values[ch] = 0
+      # the raw values are read-only views on the received message, they can be queued without copy
+      if self.log_meters:
+        self.meter_log_queue.append((time.time(), raw_values[:len_meter2], self.input_rta_raw, self.dyn_raw,
+                                     self.meter_log_fresh | meterlog.fresh_inputs))
+      self.meter_log_fresh = 0
+      input_values = read_only(values[:len_meter2])
+      self.begin_update()
+      try:
+        numpy.maximum(self.input_max_values, input_values, out=self.input_max_values)
+        with metrics.stage("histograms"):
+          self.input_histograms.add(input_values)
+      finally:
+        self.end_update()
+      self.publish(input_values=input_values)
+
+  def receive_rta_meter(self, message):
+    if metrics.enabled: self.check_meter_timing(message.address)
+    with metrics.stage("decode"):
+      (raw_values, values) = decode_meter_blob(message.data[0])
+    if raw_values is None or len(values) < len_meter4:
+      self.short_meter_blobs += 1
     else:
-      input_histograms   = [[0] * hist_len for i in range(len_meter2)]
-      input_max_values   = [-128] * len_meter2
-      gatedyn_min_values = [0] * len_meter6
-
-
-def switch_feedback_cancellation():
-  global do_feedback_cancel
-  do_feedback_cancel = not do_feedback_cancel
-
-
-def detect_and_cancel_feedback():
-  global feedback_count
-  with data_mutex: # lock mutex as short as possible
-    input_rta_copy = input_rta # TODO access to vectdor is arbitrary, queue would be better (would require a loop here)
-  max_index = numpy.argmax(input_rta_copy)
-  if max_index > 1 and max_index < len_meter4 - 2:
-    max_value = input_rta_copy[max_index]
-    if (input_rta_copy[max_index + 2] < max_value - feedback_threshold_dB and
-        input_rta_copy[max_index - 2] < max_value - feedback_threshold_dB):
-      feedback_count[max_index] += 1
-      if any(x >= min_feedback_count for x in feedback_count):
-        f = numpy.exp(max_index / len_meter4 * numpy.log(20000 / 20)) * 20 # inverse of mixer.freq_to_float
-        for i in range(6):
-          if mixer.get_value(f"/lr/eq/{i + 1}/g")[0] == 0.5: # find free EQ band
-            print(f"Feedback cancelled at frequency: {f}")
-            mixer.set_value(f"/lr/eq/{i + 1}/type", [2]) # PEQ
-            mixer.set_value(f"/lr/eq/{i + 1}/q", [0])    # EQ Quality 10 (minimum width)
-            mixer.set_value(f"/lr/eq/{i + 1}/g", [0.4])  # gain to -3 dB
-            mixer.set_value(f"/lr/eq/{i + 1}/f", [mixer.freq_to_float(f)])
-            mixer.set_value("/lr/eq/on", [1])
-            break;
-        feedback_count = [0 for x in feedback_count] # clear all counts
+      (raw_values, values)  = (raw_values[:len_meter4], values[:len_meter4])
+      self.input_rta_raw    = raw_values
+      self.meter_log_fresh |= meterlog.fresh_rta
+      self.begin_update()
+      try:
+        with metrics.stage("rta_history"):
+          self.rta_history.add(values, time.time())
+      finally:
+        self.end_update()
+      self.publish(input_rta=read_only(values))
+      if self.do_feedback_cancel:
+        try:
+          self.rta_queue.put_nowait(values)
+        except queue.Full:
+          self.rta_queue_drops += 1
+
+  def receive_dyn_meter(self, message):
+    if metrics.enabled: self.check_meter_timing(message.address)
+    with metrics.stage("decode"):
+      (raw_values, values) = decode_meter_blob(message.data[0])
+    if raw_values is None or len(values) < 16 + len_meter6: # dyn: 16..31
+      self.short_meter_blobs += 1
     else:
-      feedback_count = [0 for x in feedback_count] # clear all counts
+      self.dyn_raw          = raw_values
+      self.meter_log_fresh |= meterlog.fresh_dyn
+      self.begin_update()
+      try:
+        numpy.minimum(self.gatedyn_min_values, values[16:16 + len_meter6], out=self.gatedyn_min_values)
+      finally:
+        self.end_update()
+      self.publish(dyn_values=read_only(values))
+
+  def check_meter_timing(self, address):
+    # a gap of more than 1.5 meter periods counts as late frame, the missing frames as lost
+    now = time.monotonic()
+    gap = now - self.meter_arrival.get(address, now)
+    self.meter_arrival[address] = now
+    metrics.count("frames" + address.replace("/", "_"))
+    if gap > 1.5 * meter_update_s:
+      metrics.count("late" + address.replace("/", "_"))
+      metrics.count("lost" + address.replace("/", "_"), round(gap / meter_update_s) - 1)
+
+  def receive_parameter_reply(self, message):
+    self.parameter_cache.update(message.address, message.data) # query replies and /xremote pushes
+    with metrics.lock(self.reply_waiters_mutex, "reply_waiters"):
+      for reply in self.reply_waiters.get(message.address, []):
+        if reply.empty():
+          reply.put_nowait(message)
+
+  def query_value(self, address, timeout=1):
+    # replacement for mixer.get_value which would compete with the receive thread for the reply
+    replies = self.query_values([address], timeout)
+    if address not in replies:
+      raise TimeoutError(f"no reply from mixer for {address}")
+    return replies[address]
+
+  def query_values(self, addresses, timeout=1):
+    # pipelined bulk read: up to osc_batch_len requests are on the way at the same time,
+    # addresses without a reply within the timeout are missing in the returned dict
+    replies = {}
+    for i in range(0, len(addresses), osc_batch_len):
+      waiting = {address: queue.Queue(1) for address in addresses[i:i + osc_batch_len]}
+      with metrics.lock(self.reply_waiters_mutex, "reply_waiters"):
+        for (address, reply) in waiting.items():
+          self.reply_waiters.setdefault(address, []).append(reply)
+      try:
+        with metrics.stage("query_round_trip"): # one pipelined batch
+          for address in waiting:
+            self.mixer.set_value(address, [], False) # OSC message without arguments requests the current value
+          deadline = time.monotonic() + timeout
+          for (address, reply) in waiting.items():
+            try:
+              replies[address] = reply.get(timeout=max(0, deadline - time.monotonic())).data
+            except queue.Empty:
+              metrics.count("query_timeouts")
+      finally:
+        with metrics.lock(self.reply_waiters_mutex, "reply_waiters"):
+          for (address, reply) in waiting.items():
+            self.reply_waiters[address].remove(reply)
+            if not self.reply_waiters[address]:
+              del self.reply_waiters[address]
+    return replies
+
+  def send_value(self, address, values):
+    # no readback, a readback reply would be consumed by the receive thread
+    with metrics.stage("send_value"):
+      self.mixer.set_value(address, values, False)
+    self.parameter_cache.update(address, values) # the mixer does not push our own changes back to us
+
+  def queue_value(self, address, values, priority=priority_normal):
+    # rate limited and coalesced write, the cache shows the new value immediately
+    self.parameter_cache.update(address, values)
+    self.writes.put(address, values, priority)
+
+  def send_values(self, address_values):
+    # pipelined writes, a short pause after each batch so that the mixer input buffer does not overflow
+    for i in range(0, len(address_values), osc_batch_len):
+      for (address, values) in address_values[i:i + osc_batch_len]:
+        self.send_value(address, values)
+      time.sleep(0.001)
+
+  def get_cached_value(self, address, max_age_s=None):
+    values = self.parameter_cache.get(address, max_age_s)
+    if values is None:
+      values = self.query_value(address) # the reply is stored in the cache by the receive thread
+    return values
+
+  def fill_parameter_cache(self):
+    # all parameters we set on reset plus the ones we read during operation
+    addresses = list(self.band.mixer_setup(self.mixer, self.is_XR16, dyn_thresh))
+    addresses += [c.headamp[self.is_XR16][0] for c in self.band.channels]
+    addresses += [address for band in lr_eq_bands for address in band.values()]
+    self.query_values(list(dict.fromkeys(addresses)))
+
+  def get_max_levels(self):
+    if hist_decay_s:
+      return self.input_histograms.max_levels(decayed=True)
+    if max_level_window_s is None:
+      return self.input_max_values
+    return self.input_histograms.max_levels(max_level_window_s)
+
+  def reset_histograms(self, ch=None):
+    # executed by the receive thread before it processes the next meter frame
+    self.commands.append((self.execute_reset, [ch]))
+
+  def execute_reset(self, ch=None):
+    if ch is not None:
+      self.input_histograms.reset(ch)
+      self.input_max_values[ch]   = -128
+      self.gatedyn_min_values[ch] = 0
+    else:
+      self.input_histograms   = LevelHistograms(len_meter2, hist_len, meter_update_s, hist_window_s, hist_history_s,
+                                                hist_decay_s)
+      self.input_max_values   = numpy.full(len_meter2, -128, dtype=numpy.float32)
+      self.gatedyn_min_values = numpy.zeros(len_meter6, dtype=numpy.float32)
+
+  def persistent_rta_bins(self, window_s=rta_persistence_s, count=5):
+    # ringing frequencies: (RTA bins, mean dB, prominence dB) of the last window_s seconds
+    return self.read_state(lambda: self.rta_history.persistent_bins(window_s, count))
+
+  def switch_feedback_cancellation(self):
+    self.set_feedback_cancellation(not self.do_feedback_cancel)
+
+  def set_feedback_cancellation(self, on):
+    self.feedback_detector.reset() # no persistence counts from before the switch
+    self.do_feedback_cancel = on
+
+  def feedback_thread(self):
+    # consumes every RTA frame, independent of the GUI update rate
+    while not self.exit:
+      try:
+        rta = self.rta_queue.get(timeout=0.5)
+      except queue.Empty:
+        continue
+      for index in self.detect_feedback(rta):
+        with metrics.stage("feedback_cancel"):
+          self.cancel_feedback(index)
+
+  def detect_feedback(self, rta):
+    # RTA bins with detected feedback
+    if not self.do_feedback_cancel:
+      self.feedback_detector.reset()
+      return []
+    with metrics.stage("feedback_detect"):
+      return self.feedback_detector.update(rta)
+
+  def cancel_feedback(self, index):
+    f = rta_frequency(index, len_meter4)
+    try:
+      for band in lr_eq_bands:
+        if self.get_cached_value(band["g"])[0] == 0.5: # find free EQ band
+          print(f"Feedback cancelled at frequency: {f}")
+          self.queue_value(band["type"], [2], priority_feedback) # PEQ
+          self.queue_value(band["q"], [0], priority_feedback)    # EQ Quality 10 (minimum width)
+          self.queue_value(band["g"], [0.4], priority_feedback)  # gain to -3 dB
+          self.queue_value(band["f"], [self.mixer.freq_to_float(f)], priority_feedback)
+          self.queue_value("/lr/eq/on", [1], priority_feedback)
+          return
+    except TimeoutError: # e.g. lost reply after a cache invalidation, the next detection tries again
+      self.feedback_timeouts += 1
+      print(f"Feedback at frequency {f} not cancelled, no reply from mixer")
+      return
+    print(f"Feedback at frequency {f} not cancelled, no free master EQ band")
+
+  def store_input_levels_in_file(self):
+    # one record per /meters/2 frame with the latest RTA and dyn values, see meterlog.py and analyze.py
+    writer = self.open_meter_log()
+    while not self.exit:
+      self.write_meter_log(writer)
+      if not self.exit: time.sleep(1) # every second append logging file
+    writer.close()
+
+  def open_meter_log(self):
+    return meterlog.MeterLogWriter(time.strftime(self.log_path), len_meter2, len_meter4, len_meter6_all,
+                                   self.band.names(), frame_period_s=meter_update_s,
+                                   start_time=time.time())
+
+  def write_meter_log(self, writer):
+    with metrics.stage("log_write"):
+      while self.meter_log_queue: # deque is thread safe, no mutex needed
+        writer.add(*self.meter_log_queue.popleft())
+      writer.flush()
+
+
+def read_only(values):
+  values.flags.writeable = False
+  return values
 
 
 def change_channel(c):
@@ -367,14 +803,44 @@ def change_channel(c):
   channel = int(c)
 
 
-def apply_optimal_gains():
-  for ch in range(len(channel_dict)):
-    apply_optimal_gain(ch, reset=False)
-  reset_histograms() # history needs to be reset on updated gain settings
-
-
-def gui_thread():
-  global exit_threads, channel
+def gui_view(snapshot, channel):
+  # everything the GUI shows of a snapshot, computed without Tk (label color None: window color)
+  level_labels = []
+  for max_value in numpy.ceil(snapshot.max_levels).astype(int).tolist():
+    if max_value > target_max_gain + 6:
+      level_labels.append((max_value, "red"))
+    elif (max_value > set_gain_input_thresh and max_value < target_max_gain - 6) or max_value > target_max_gain + 3:
+      level_labels.append((max_value, "yellow"))
+    else:
+      level_labels.append((max_value, None))
+  dyn_labels = []
+  for max_value in numpy.round(-snapshot.gatedyn_min_values).astype(int).tolist():
+    if max_value > 9:
+      dyn_labels.append((max_value, "red"))
+    elif max_value > 6:
+      dyn_labels.append((max_value, "yellow"))
+    elif max_value > 0:
+      dyn_labels.append((max_value, None))
+    else: # do not show any number if dyn is not used
+      dyn_labels.append(("", None))
+  histogram = snapshot.histograms[channel]
+  max_hist  = histogram.max()
+  return GuiView(numpy.round((snapshot.input_values / 128 + 1) * 100, 1).tolist(), level_labels, dyn_labels,
+                 line_heights((snapshot.input_rta / 128 + 1) * rta_hist_height),
+                 line_heights(histogram * rta_hist_height / max_hist) if max_hist > 0 else None,
+                 int(numpy.argmax(histogram)))
+
+
+def line_heights(heights):
+  return numpy.clip(heights, 0, rta_hist_height).astype(int)
+
+
+def run_gui(engine):
+  # optional observer of the engine, only reads snapshots (imported here, not needed headless)
+  import easygui
+  import matplotlib.pyplot as plt # TODO somehow needed for "messagebox.askyesno"?
+  import tkinter as tk
+  from tkinter import ttk
   window = tk.Tk(className="XR Auto Mix")
   window_color = window.cget("bg")
   (input_bars, input_labels, dyn_labels, rta_bars) = ([], [], [], [])
@@ -385,20 +851,20 @@ def gui_thread():
   selection_f.pack()
 
   # buttons
-  tk.Button(buttons_f, text="Reset Histograms", command=lambda: reset_histograms()).pack(side='left')
-  tk.Button(buttons_f, text="Apply All Gains", command=lambda: apply_optimal_gains()).pack(side='left')
-  tk.Button(buttons_f, text="Apply Selected Gain", command=lambda: apply_optimal_gain(channel)).pack(side='left')
-  b_feedback = tk.Button(buttons_f, text="Feedback Cancellation", command=lambda: switch_feedback_cancellation())
+  tk.Button(buttons_f, text="Reset Histograms", command=lambda: engine.reset_histograms()).pack(side='left')
+  tk.Button(buttons_f, text="Apply All Gains", command=lambda: engine.apply_optimal_gains()).pack(side='left')
+  tk.Button(buttons_f, text="Apply Selected Gain", command=lambda: engine.apply_optimal_gain(channel)).pack(side='left')
+  b_feedback = tk.Button(buttons_f, text="Feedback Cancellation", command=lambda: engine.switch_feedback_cancellation())
   b_feedback.pack(side='left')
-  tk.Button(buttons_f, text="Reset All", command=lambda: basic_setup_mixer(mixer)).pack(side='left')
+  tk.Button(buttons_f, text="Reset All", command=lambda: reset_all()).pack(side='left')
 
   # input level meters
   for i in range(len_meter2):
     f = tk.Frame(inputs_f)
     f.pack(side="left", pady='5')
-    if i < len(channel_dict):
+    if i < len(engine.band.channels):
       tk.Radiobutton(f, value=i, indicatoron=0, variable=radio_button_var, \
-        command=lambda: change_channel(radio_button_var.get()), text=f"{i + 1}\n{channel_dict[i][0]}").pack()
+        command=lambda: change_channel(radio_button_var.get()), text=f"{i + 1}\n{engine.band.channels[i].name}").pack()
     else:
       tk.Radiobutton(f, value=i, indicatoron=0, variable=radio_button_var, \
         command=lambda: change_channel(radio_button_var.get()), text=f"{i + 1}\n").pack()
@@ -409,80 +875,98 @@ def gui_thread():
     dyn_labels.append(tk.Label(f))
     dyn_labels[i].pack()
 
-  # RTA/histogram
+  # RTA/histogram, the canvas items are created once and then only moved
   rta = tk.Canvas(window, width=len_meter4 * rta_line_width + len_meter4, height=rta_hist_height)
   rta.pack()
   hist = tk.Canvas(window, width=hist_len * hist_line_width + hist_len, height=rta_hist_height)
   hist.pack()
-
-  while not exit_threads:
+  rta_x  = rta_line_width + numpy.arange(len_meter4) * (rta_line_width + 1)
+  hist_x = hist_line_width + numpy.arange(hist_len) * (hist_line_width + 1)
+  rta_lines  = [rta.create_line(x, rta_hist_height, x, rta_hist_height, fill="#476042", width=rta_line_width)
+                for x in rta_x]
+  hist_lines = [hist.create_line(x, rta_hist_height, x, rta_hist_height, fill="#476042", width=hist_line_width)
+                for x in hist_x]
+  frame_time_label = tk.Label(window)
+  frame_time_label.pack()
+
+  # last shown state, widgets are only touched if something changed
+  shown = {"rta": numpy.full(len_meter4, -1), "hist": numpy.full(hist_len, -1), "hist_max_index": -1,
+           "bars": [None] * len_meter2, "labels": {}, "feedback": None, "persistent": set(), "persistent_time": 0}
+  frame_times = {"sum": 0.0, "max": 0.0, "count": 0, "start": time.monotonic()}
+
+  def reset_all():
+    if easygui.ynbox('Are you sure to reset all mixer settings?', 'Reset All Check', ['Yes', 'No']):
+      try:
+        engine.basic_setup_mixer()
+      except:
+        easygui.msgbox('Reset failed!')
+
+  def config_label(label, text, bg):
+    if shown["labels"].get(label) != (text, bg):
+      shown["labels"][label] = (text, bg)
+      label.config(text=text, bg=bg or window_color)
+
+  def move_lines(canvas, lines, x, heights, key):
+    for i in numpy.flatnonzero(heights != shown[key]):
+      canvas.coords(lines[i], x[i], rta_hist_height, x[i], rta_hist_height - heights[i])
+    shown[key] = heights
+
+  def redraw():
+    if engine.exit:
+      window.destroy()
+      return
+    start_time = time.monotonic()
     try:
-      with data_mutex: # lock mutex as short as possible
-        input_values_copy = input_values
-        input_rta_copy    = input_rta
+      view = gui_view(engine.snapshot(hist_gui_window_s), channel)
       for ch in range(len_meter2):
-        input_bars[ch].set((input_values_copy[ch] / 128 + 1) * 100)
-        max_value = int(numpy.ceil(input_max_values[ch]))
-        if max_value > target_max_gain + 6:
-          input_labels[ch].config(text=max_value, bg="red")
-        else:
-          if (max_value > set_gain_input_thresh and max_value < target_max_gain - 6) or max_value > target_max_gain + 3:
-            input_labels[ch].config(text=max_value, bg="yellow")
-          else:
-            input_labels[ch].config(text=max_value, bg=window_color)
+        if view.bars[ch] != shown["bars"][ch]:
+          shown["bars"][ch] = view.bars[ch]
+          input_bars[ch].set(view.bars[ch])
+        config_label(input_labels[ch], *view.level_labels[ch])
       for ch in range(len_meter6):
-        max_value = int(numpy.round(-gatedyn_min_values[ch]))
-        if max_value > 9:
-          dyn_labels[ch].config(text=max_value, bg="red")
-        else:
-          if max_value > 6:
-            dyn_labels[ch].config(text=max_value, bg="yellow")
-          elif max_value > 0:
-            dyn_labels[ch].config(text=max_value, bg=window_color)
-          else: # do not show any number if dyn is not used
-            dyn_labels[ch].config(text="", bg=window_color)
-
-      rta.delete("all")
-      for i in range(len_meter4):
-        x = rta_line_width + i * rta_line_width + i
-        y = (input_rta_copy[i] / 128 + 1) * rta_hist_height
-        rta.create_line(x, rta_hist_height, x, rta_hist_height - y, fill="#476042", width=rta_line_width)
-
-      max_hist  = max(input_histograms[channel])
-      max_index = numpy.argmax(input_histograms[channel])
-      if max_hist > 0:
-        hist.delete("all")
-        for i in range(hist_len):
-          x = hist_line_width + i * hist_line_width + i
-          y = input_histograms[channel][i] * rta_hist_height / max_hist
-          color = "blue" if i == max_index else "#476042"
-          hist.create_line(x, rta_hist_height, x, rta_hist_height - y, fill=color, width=hist_line_width)
-
-      if do_feedback_cancel:
-        b_feedback.config(bg="red")
-        detect_and_cancel_feedback()
-      else:
-        b_feedback.config(bg=window_color)
-
-      window.update()
-      time.sleep(meter_update_s)
+        config_label(dyn_labels[ch], *view.dyn_labels[ch])
+
+      move_lines(rta, rta_lines, rta_x, view.rta_heights, "rta")
+      if time.monotonic() - shown["persistent_time"] >= 1: # mark ringing frequencies, once per second
+        shown["persistent_time"] = time.monotonic()
+        persistent = set(engine.persistent_rta_bins()[0].tolist())
+        for i in persistent ^ shown["persistent"]:
+          rta.itemconfig(rta_lines[i], fill="orange" if i in persistent else "#476042")
+        shown["persistent"] = persistent
+
+      if view.hist_heights is not None:
+        move_lines(hist, hist_lines, hist_x, view.hist_heights, "hist")
+        if view.hist_max_index != shown["hist_max_index"]:
+          if shown["hist_max_index"] >= 0:
+            hist.itemconfig(hist_lines[shown["hist_max_index"]], fill="#476042")
+          hist.itemconfig(hist_lines[view.hist_max_index], fill="blue")
+          shown["hist_max_index"] = view.hist_max_index
+
+      if engine.do_feedback_cancel != shown["feedback"]:
+        shown["feedback"] = engine.do_feedback_cancel
+        b_feedback.config(bg="red" if engine.do_feedback_cancel else window_color)
     except:
-      exit_threads = True
-
-
-def store_input_levels_in_file():
-  # Octave: h=fopen('test.dat','rb');x=fread(h,Inf,'int16');fclose(h);x=reshape(x,18,[])/256;close all;plot(x.')
-  while not exit_threads:
-    with data_mutex:
-      cur_list_data = [] # just do copy in mutex and not the actual file storage
-      while all_raw_inputs_queue:
-        cur_list_data.append(all_raw_inputs_queue.popleft())
-    with open(file_path, "ab") as file:
-      for data in cur_list_data:
-        file.write(struct.pack('%sh' % len(data), *data))
-    if not exit_threads: time.sleep(1) # every second append logging file
+      engine.exit = True
+      window.destroy()
+      return
+
+    # frame time statistics, shown once per second
+    frame_time = time.monotonic() - start_time
+    if metrics.enabled: metrics.record("gui_redraw", frame_time)
+    frame_times["sum"]  += frame_time
+    frame_times["max"]   = max(frame_times["max"], frame_time)
+    frame_times["count"] += 1
+    if time.monotonic() - frame_times["start"] >= 1:
+      frame_time_label.config(text=f"redraw {frame_times['sum'] / frame_times['count'] * 1e3:.2f} ms " \
+                                   f"(max {frame_times['max'] * 1e3:.2f} ms), " \
+                                   f"{frame_times['count'] / (time.monotonic() - frame_times['start']):.1f} fps")
+      frame_times.update({"sum": 0.0, "max": 0.0, "count": 0, "start": time.monotonic()})
+    window.after(max(1, round(1000 / gui_frame_rate - frame_time * 1000)), redraw)
+
+  window.after(0, redraw)
+  window.mainloop() # redraw runs on the Tk scheduler
+  engine.exit = True
 
 
 if __name__ == '__main__':
   main()
-